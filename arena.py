@@ -0,0 +1,276 @@
+'''
+self-play tournament between agents
+
+    python arena.py --agents random mcts:100 mcts:400 numba:2000 --games 40 --workers 4 --out arena.jsonl
+
+agents are given as specs:
+    random          uniform over the valid actions
+    mcts:n          mcts.run with n iterations
+    mcts_ms:t       mcts.run_timed with a t millisecond budget per move
+    numba:n         mcts_numba.search with n iterations
+
+games are dealt round robin over every pair of agents with seats swapped on alternate rounds.
+each game is seeded, its board comes from BMBoard.restart_board, or SparseBMBoard with --engine sparse
+for large boards. one json line per game is written
+to the output as soon as it finishes, followed by a summary line with win rates and elo ratings.
+'''
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from bm import BMBoard, PackedBMBoard
+from bm_sparse import SparseBMBoard
+
+
+class RandomAgent:
+    def act(self, game, state, player):
+        return np.random.choice(game.valid_actions(player, state))
+
+
+class MCTSAgent:
+    '''
+    keeps its tree between moves, the root is moved down to the state actually reached when this agent's
+    action and the opponent's reply were both searched (mcts.advance_root). reused counts the moves
+    that continued from the previous tree, out of moves
+    '''
+    def __init__(self, n=None, time_budget_ms=None):
+        import mcts
+        self.mcts = mcts
+        self.n = n
+        self.time_budget_ms = time_budget_ms
+        self.root = None
+        self.action = None
+        self.moves = 0
+        self.reused = 0
+
+    def _follow(self, state):
+        '''
+        node for state below the last root through the last action and a searched reply, None if there is none
+        '''
+        if self.root == None or self.action not in self.root.child_actions:
+            return None
+        first = self.root.children[self.root.child_actions.index(self.action)]
+        for reply, child in zip(first.child_actions, first.children):
+            if child.state != None and self.mcts.same_state(child.state, state):
+                return self.mcts.advance_root(self.root, [self.action, reply], state)
+        return None
+
+    def act(self, game, state, player):
+        root = self._follow(state)
+        if root == None:
+            # the root is entered by the other player so the search plays for player
+            root = self.mcts.Node(state, player=3 - player)
+        else:
+            self.reused += 1
+        self.moves += 1
+        if self.time_budget_ms != None:
+            action = self.mcts.run_timed(game, root, self.time_budget_ms)['action']
+        else:
+            action = self.mcts.run(game, root, self.n)
+        self.root, self.action = root, action
+        return action
+
+
+class NumbaAgent:
+    def __init__(self, n):
+        import bm_numba
+        import mcts_numba
+        self.bm_numba = bm_numba
+        self.mcts_numba = mcts_numba
+        self.n = n
+        self.engines = {}
+
+    def act(self, game, state, player):
+        # engine tuples use only cached kernels, so worker processes skip compiling the jitclass
+        if game.board_width not in self.engines:
+            self.engines[game.board_width] = self.bm_numba.make_engine(game.board_width)
+        if isinstance(game, PackedBMBoard):
+            state = game.unpack_board_state(state)
+        # bm_numba keeps the first four player_meta columns and int_ layers
+        numba_state = tuple(layer.astype(np.int_) for layer in state[:5]) + (state[5][:, :4].astype(np.int_), state[6])
+        seed = np.random.randint(2**31)
+        best_action = self.mcts_numba.search_kernel(self.engines[game.board_width], numba_state, self.n, seed, player)[0]
+        return int(best_action)
+
+
+def parse_spec(spec):
+    '''
+    (name, argument) of an agent spec string, see the module docstring
+    '''
+    name, _, arg = spec.partition(':')
+    try:
+        if name == 'random' and arg == '':
+            return name, None
+        if name in ('mcts', 'numba'):
+            return name, int(arg)
+        if name == 'mcts_ms':
+            return name, float(arg)
+    except ValueError:
+        pass
+    raise ValueError(f'invalid agent spec {spec}')
+
+
+def make_agent(spec):
+    '''
+    agent from a spec string
+    '''
+    name, arg = parse_spec(spec)
+    if name == 'random':
+        return RandomAgent()
+    if name == 'mcts':
+        return MCTSAgent(n=arg)
+    if name == 'mcts_ms':
+        return MCTSAgent(time_budget_ms=arg)
+    return NumbaAgent(arg)
+
+
+# agents built in this process, kept so compiled / imported state is reused between games
+_agents = {}
+
+def _get_agent(spec):
+    if spec not in _agents:
+        _agents[spec] = make_agent(spec)
+    return _agents[spec]
+
+
+ENGINES = {'dense': BMBoard, 'sparse': SparseBMBoard}
+
+
+def play_game(game_id, p1_spec, p2_spec, seed, board_width=7, start_health=3, start_ammo=3, max_steps=200, engine='dense'):
+    '''
+    play one game between the agents p1_spec and p2_spec, returns its result record.
+    a game still running after max_steps is a draw
+    '''
+    np.random.seed(seed)
+    game = ENGINES[engine](board_width, start_health, start_ammo)
+    state = game.restart_board()
+    # an agent keeps state between moves, so a spec playing itself gets a second agent
+    agents = {1: _get_agent(p1_spec), 2: _get_agent(p2_spec) if p2_spec != p1_spec else make_agent(p2_spec)}
+    move_time = {1: 0.0, 2: 0.0}
+    # moves that continued from the agent's previous tree, for agents that keep one
+    reused = {p: getattr(agents[p], 'reused', None) for p in (1, 2)}
+
+    t0 = time.perf_counter()
+    steps = 0
+    while not state[-1] and steps < max_steps:
+        actions = []
+        for p in (1, 2):
+            t = time.perf_counter()
+            actions.append((p, agents[p].act(game, state, p)))
+            move_time[p] += time.perf_counter() - t
+        state = game.step(actions, True, *state[:-1])
+        steps += 1
+
+    meta = state[-2]
+    alive = meta[meta[:, 1] > 0, 0]
+    winner = int(alive[0]) if len(alive) == 1 else 0
+    return {
+        'type': 'game',
+        'game': game_id,
+        'seed': seed,
+        'p1': p1_spec,
+        'p2': p2_spec,
+        'winner': winner,
+        'winner_agent': {0: None, 1: p1_spec, 2: p2_spec}[winner],
+        'steps': steps,
+        'health': meta[:, 1].tolist(),
+        'seconds': time.perf_counter() - t0,
+        'p1_ms_per_move': move_time[1]/max(steps, 1)*1000,
+        'p2_ms_per_move': move_time[2]/max(steps, 1)*1000,
+        'p1_reuse_rate': None if reused[1] == None else (agents[1].reused - reused[1])/max(steps, 1),
+        'p2_reuse_rate': None if reused[2] == None else (agents[2].reused - reused[2])/max(steps, 1)
+    }
+
+
+def schedule(agent_specs, n_games, seed=None):
+    '''
+    (game_id, p1_spec, p2_spec, seed) for n_games dealt round robin over every pair of agents
+    '''
+    pairs = list(itertools.combinations(agent_specs, 2))
+    seeds = np.random.SeedSequence(seed).generate_state(n_games)
+    games = []
+    for i in range(n_games):
+        a, b = pairs[i % len(pairs)]
+        if (i // len(pairs)) % 2 == 1:
+            a, b = b, a
+        games.append((i, a, b, int(seeds[i])))
+    return games
+
+
+def summarize(results, agent_specs, k=16, start_rating=1000):
+    '''
+    win rates per agent and elo ratings updated over the games in game order
+    '''
+    stats = {spec: {'games': 0, 'wins': 0, 'losses': 0, 'draws': 0} for spec in agent_specs}
+    elo = {spec: float(start_rating) for spec in agent_specs}
+    for r in sorted(results, key=lambda r: r['game']):
+        p1, p2 = r['p1'], r['p2']
+        score = {1: 1.0, 2: 0.0, 0: 0.5}[r['winner']]
+        for spec, s in ((p1, score), (p2, 1 - score)):
+            stats[spec]['games'] += 1
+            stats[spec]['wins' if s == 1 else 'losses' if s == 0 else 'draws'] += 1
+
+        expected = 1/(1 + 10**((elo[p2] - elo[p1])/400))
+        elo[p1] += k*(score - expected)
+        elo[p2] -= k*(score - expected)
+
+    for spec, s in stats.items():
+        s['win_rate'] = s['wins']/s['games'] if s['games'] > 0 else 0.0
+        s['elo'] = elo[spec]
+    return {'type': 'summary', 'games': len(results), 'agents': stats}
+
+
+def run_arena(agent_specs, n_games, workers=None, out='arena.jsonl', seed=None, **game_kwargs):
+    '''
+    play n_games between agent_specs on a process pool, streaming results to out.
+    returns the summary
+    '''
+    games = schedule(agent_specs, n_games, seed)
+    results = []
+    with open(out, 'w') as f, ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [pool.submit(play_game, *g, **game_kwargs) for g in games]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+        summary = summarize(results, agent_specs)
+        f.write(json.dumps(summary) + '\n')
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', nargs='+', default=['random', 'mcts:100'])
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--health', type=int, default=3)
+    parser.add_argument('--ammo', type=int, default=3)
+    parser.add_argument('--max-steps', type=int, default=200)
+    parser.add_argument('--engine', default='dense', choices=list(ENGINES))
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default='arena.jsonl')
+    args = parser.parse_args(argv)
+
+    if len(args.agents) < 2:
+        parser.error('at least two agents are needed')
+    for spec in args.agents:
+        try:
+            parse_spec(spec)
+        except ValueError as e:
+            parser.error(str(e))
+
+    summary = run_arena(args.agents, args.games, args.workers, args.out, args.seed,
+                        board_width=args.width, start_health=args.health, start_ammo=args.ammo,
+                        max_steps=args.max_steps, engine=args.engine)
+    for spec, s in sorted(summary['agents'].items(), key=lambda item: -item[1]['elo']):
+        print(f"{spec:>16} elo {s['elo']:7.1f}  win rate {s['win_rate']:.2f}  w/l/d {s['wins']}/{s['losses']}/{s['draws']}")
+    return summary
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+'''
+benchmarks for the board engines and the search
+
+    python bench.py --engines python numba --widths 5 9 15 --densities 0 0.1 --out bench.json
+
+engines are python (BMBoard), sparse (SparseBMBoard) and numba.
+every (engine, board width, bomb density) combination is timed on four workloads: step throughput,
+valid_actions latency, random rollouts and mcts iterations. numba compile time is measured on the
+first call of each compiled function and reported separately as warmup records.
+results are written as json so runs can be compared.
+'''
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+
+
+def seed_bombs(game, state, density, rng):
+    '''
+    copy of state with bombs on a density fraction of the floor cells, timers are drawn uniformly
+    '''
+    state = tuple(layer.copy() if isinstance(layer, np.ndarray) else layer for layer in state)
+    board, bombs_board = state[0], state[1]
+    floor = np.argwhere((board == 0) & (bombs_board == 0))
+    n_bombs = int(round(density*len(floor)))
+    if n_bombs > 0:
+        ys, xs = floor[rng.choice(len(floor), n_bombs, replace=False)].T
+        bombs_board[ys, xs] = rng.integers(1, game._bomb_life + 1, n_bombs)
+    return state
+
+
+def timed(fn, seconds):
+    '''
+    call fn until seconds have passed, fn returns the number of operations it did.
+    returns (operations, elapsed seconds)
+    '''
+    ops = 0
+    t0 = time.perf_counter()
+    while True:
+        ops += fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= seconds:
+            return ops, elapsed
+
+
+class PythonEngine:
+    name = 'python'
+
+    def __init__(self):
+        import bm
+        import mcts
+        self.bm = bm
+        self.mcts = mcts
+
+    def new_game(self, width):
+        return self.bm.BMBoard(width, 3, 3)
+
+    def initial_state(self, game, density, rng):
+        return seed_bombs(game, game.board_state, density, rng)
+
+    def actions(self, a1, a2):
+        return [(1, a1), (2, a2)]
+
+    def rollout(self, game, state, rng, max_steps):
+        steps = 0
+        while not state[-1] and steps < max_steps:
+            state = game.step(self.actions(rng.integers(5), rng.integers(5)), True, *state[:-1])
+            steps += 1
+
+    def search(self, game, state, seconds, seed):
+        np.random.seed(seed)
+        stats = self.mcts.run_timed(game, self.mcts.Node(state), seconds*1000)
+        return stats['iterations'], stats['iterations']/stats['iterations_per_sec']
+
+
+class SparseEngine(PythonEngine):
+    name = 'sparse'
+
+    def new_game(self, width):
+        import bm_sparse
+        return bm_sparse.SparseBMBoard(width, 3, 3)
+
+    def initial_state(self, game, density, rng):
+        return game.pack_board_state(seed_bombs(game, game.unpack_board_state(game.board_state), density, rng))
+
+
+class NumbaEngine:
+    name = 'numba'
+
+    def __init__(self):
+        import bm_numba
+        import mcts_numba
+        self.bm = bm_numba
+        self.mcts_numba = mcts_numba
+
+    def new_game(self, width):
+        return self.bm.BMBoard(width, 3, 3)
+
+    def initial_state(self, game, density, rng):
+        return seed_bombs(game, game.board_state, density, rng)
+
+    def actions(self, a1, a2):
+        return np.array([[1, a1], [2, a2]], dtype=np.int_)
+
+    def rollout(self, game, state, rng, max_steps):
+        self.mcts_numba.rollout(game.engine, state, max_steps)
+
+    def search(self, game, state, seconds, seed):
+        n = 64
+        while True:
+            t0 = time.perf_counter()
+            self.mcts_numba.search(game, state, n, seed)
+            elapsed = time.perf_counter() - t0
+            if elapsed >= seconds:
+                return n, elapsed
+            n *= 2
+
+    def warmup(self, width):
+        '''
+        seconds spent on the first call of each compiled function, which includes compilation
+        '''
+        timings = {}
+        t0 = time.perf_counter()
+        game = self.new_game(width)
+        timings['BMBoard'] = time.perf_counter() - t0
+        state = game.board_state
+
+        t0 = time.perf_counter()
+        game.step(self.actions(6, 6), True, *state[:-1])
+        timings['step'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        game.valid_actions(1, state)
+        timings['valid_actions'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        self.mcts_numba.rollout(game.engine, state, 1)
+        timings['rollout'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        self.mcts_numba.search(game, state, 1, 0)
+        timings['search'] = time.perf_counter() - t0
+        return timings
+
+
+ENGINES = {'python': PythonEngine, 'sparse': SparseEngine, 'numba': NumbaEngine}
+
+
+def bench_config(engine, width, density, seconds, seed):
+    '''
+    all workloads for one engine, board width and bomb density, returns a list of result records
+    '''
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    game = engine.new_game(width)
+    state = engine.initial_state(game, density, rng)
+    config = {'engine': engine.name, 'width': width, 'density': density}
+    results = []
+
+    # step throughput, random actions from the seeded state, restarting from it when a game ends
+    current = [state]
+    def steps():
+        s = current[0]
+        for _ in range(100):
+            s = game.step(engine.actions(rng.integers(5), rng.integers(5)), True, *s[:-1])
+            if s[-1]:
+                s = state
+        current[0] = s
+        return 100
+    ops, elapsed = timed(steps, seconds)
+    results.append(dict(config, workload='step', ops=ops, seconds=elapsed, steps_per_sec=ops/elapsed))
+
+    # valid_actions latency
+    def valid_actions():
+        for _ in range(100):
+            game.valid_actions(1, state)
+        return 100
+    ops, elapsed = timed(valid_actions, seconds)
+    results.append(dict(config, workload='valid_actions', ops=ops, seconds=elapsed, us_per_call=elapsed/ops*1e6))
+
+    # random rollouts capped like the mcts rollouts
+    def rollouts():
+        engine.rollout(game, state, rng, 11)
+        return 1
+    ops, elapsed = timed(rollouts, seconds)
+    results.append(dict(config, workload='rollout', ops=ops, seconds=elapsed, games_per_sec=ops/elapsed))
+
+    # mcts iterations
+    ops, elapsed = engine.search(game, state, seconds, seed)
+    results.append(dict(config, workload='mcts', ops=ops, seconds=elapsed, iterations_per_sec=ops/elapsed))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--widths', nargs='+', type=int, default=[5, 7, 9, 11, 13, 15])
+    parser.add_argument('--densities', nargs='+', type=float, default=[0.0, 0.1, 0.25])
+    parser.add_argument('--seconds', type=float, default=0.5, help='time spent on each workload')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench.json')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.engines:
+        engine = ENGINES[name]()
+        if hasattr(engine, 'warmup'):
+            timings = engine.warmup(args.widths[0])
+            results.append({'engine': name, 'workload': 'warmup', 'seconds': sum(timings.values()), 'timings': timings})
+            print(name, 'warmup', round(sum(timings.values()), 2), 's')
+        for width in args.widths:
+            for density in args.densities:
+                for record in bench_config(engine, width, density, args.seconds, args.seed):
+                    results.append(record)
+                    rate = {k: v for k, v in record.items() if k.endswith('_sec') or k.startswith('us_')}
+                    print(name, width, density, record['workload'], {k: round(v, 1) for k, v in rate.items()})
+
+    import numba
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'numba': numba.__version__,
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
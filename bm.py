@@ -1,10 +1,7 @@
 import numpy as np
 from enum import Enum
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-from copy import deepcopy
+from copy import copy, deepcopy
 import time
-from IPython import display
 
 
 class Actions(Enum):
@@ -27,6 +24,16 @@ class Entities(Enum):
     POWERUP = 7
 
 
+# legal action masks are ints with bit a set when the action with value a is legal
+_MASK_ACTIONS = [[a.value for a in Actions if m >> a.value & 1] for m in range(1 << (Actions.NONE.value + 1))]
+
+def mask_to_actions(mask):
+    '''
+    action values set in a legal action mask, in Actions order
+    '''
+    return list(_MASK_ACTIONS[mask])
+
+
 class BMBoard:
     def __init__(self, board_width=9, start_health=3, start_ammo=3):
         self.board_width = board_width
@@ -39,6 +46,9 @@ class BMBoard:
         ]
         self.p1pos = (0,0)
         self.p2pos = (self.board_shape[0]-1, self.board_shape[0]-1)
+        # flat index of the neighbour of every cell in each move direction, -1 off the board
+        self._neighbors = self._neighbor_table()
+        self._neighbor_cells = self._neighbors.tolist()
         
         self.board = None
         self.bombs_board = None
@@ -60,13 +70,24 @@ class BMBoard:
         self._obstacles = [Entities.BLOCK.value, Entities.BOMB.value, Entities.P1.value, Entities.P2.value]
         self._obtainable = [Entities.POWERUP.value, Entities.AMMO.value]
 
-        # player_id, health, ammo, power
+        # player_id, health, ammo, power, y, x
         self.player_meta = np.array([
-            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power],
-            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power]
+            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power, *self.p1pos],
+            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power, *self.p2pos]
         ], dtype=np.int32)
+        # player_meta row of each player
+        self._meta_rows = {Entities.P1.value: 0, Entities.P2.value: 1}
 
         self.done = False
+        self._undo_stack = []
+        # bomb_fuses of the internal board state, danger_board is built from them on access
+        self.fuses = {}
+        self._danger_board = None
+        # blast rays per (y, x, power), filled on first use
+        self._rays = {}
+        # (bomb cells, fire cells) of the internal board state for apply, found on first use
+        self._live = None
+        self._scratch = None
         self.restart_board()
 
 
@@ -74,6 +95,9 @@ class BMBoard:
         return str(self.board + self.bombs_board + self.fire_board)
 
     def render(self, boards=None):
+        # matplotlib is only imported when rendering so the engine stays headless
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import ListedColormap
         cm = ListedColormap(["grey", "blue", "red", "saddlebrown", "black", "yellow"])
 
         if boards == None:
@@ -122,13 +146,17 @@ class BMBoard:
         self.ammo_board = np.zeros_like(self.board)
         self.powerup_board = np.zeros_like(self.board)
 
-        # player_id, health, ammo, power
+        # player_id, health, ammo, power, y, x
         self.player_meta = np.array([
-            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power],
-            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power]
+            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power, *self.p1pos],
+            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power, *self.p2pos]
         ], dtype=np.int32)
 
         self.done = False
+        self._undo_stack = []
+        self.fuses = {}
+        self._danger_board = None
+        self._live = (set(), set())
 
         return self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done
 
@@ -136,38 +164,80 @@ class BMBoard:
     def board_state(self):
         return self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done
 
+    @property
+    def danger_board(self):
+        '''
+        danger_map of the internal board state, built from fuses on the first access after it changes
+        so steps never touch a full board layer for it
+        '''
+        if self._danger_board is None:
+            self._danger_board = self.danger_map(self.board_state, self.fuses)
+        return self._danger_board
+
+
+    def _neighbor_table(self):
+        w = self.board_width
+        ys, xs = np.divmod(np.arange(w*w), w)
+        table = np.full((w*w, len(self.action_direction)), -1, dtype=np.int64)
+        for a, (dy, dx) in enumerate(self.action_direction):
+            ny, nx = ys + dy, xs + dx
+            inside = (ny >= 0) & (ny < w) & (nx >= 0) & (nx < w)
+            table[inside, a] = (ny*w + nx)[inside]
+        return table
+
+
+    def legal_action_mask(self, player_id, board_states):
+        '''
+        legal actions of player_id in the given board state as an int mask, bit a is set when action value a is legal
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        pm_idx = self._meta_rows[player_id]
+        py, px = player_meta[pm_idx, 4], player_meta[pm_idx, 5]
+        entity_flat = entity_board.ravel()
+        bombs_flat = bombs_board.ravel()
+
+        mask = 1 << Actions.NONE.value
+        # moves onto free in-bounds cells
+        for a, n in enumerate(self._neighbor_cells[py*self.board_width + px]):
+            if n >= 0 and entity_flat[n] == 0 and bombs_flat[n] == 0:
+                mask |= 1 << a
+        # bomb if not standing on one and the player has ammo
+        if bombs_board[py, px] == 0 and player_meta[pm_idx, 2] > 0:
+            mask |= 1 << Actions.BOMB.value
+        return mask
+
+
+    def legal_action_masks(self, player_id, board_states):
+        '''
+        legal_action_mask over a batch of board states with every layer stacked along a leading game axis,
+        e.g. VecBMBoard.board_state. returns an (n_games,) array of masks
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        n_games = len(entity_board)
+        games = np.arange(n_games)
+        entity_flat = entity_board.reshape(n_games, -1)
+        bombs_flat = bombs_board.reshape(n_games, -1)
+        pm_idx = self._meta_rows[player_id]
+
+        # batched states may not carry positions in player_meta, so locate the player on the board
+        cells = np.argmax(entity_flat == player_id, axis=1)
+        neighbors = self._neighbors[cells]
+        inside = neighbors >= 0
+        neighbors = np.where(inside, neighbors, 0)
+        free = inside & (entity_flat[games[:, None], neighbors] == 0) & (bombs_flat[games[:, None], neighbors] == 0)
+
+        masks = (free.astype(np.int64) << np.arange(len(self.action_direction))).sum(axis=1)
+        can_bomb = (bombs_flat[games, cells] == 0) & (player_meta[:, pm_idx, 2] > 0)
+        masks |= can_bomb.astype(np.int64) << Actions.BOMB.value
+        masks |= 1 << Actions.NONE.value
+        return masks
+
 
     def valid_actions(self, player_id, board_states):
         '''
         returns a list of valid actions from the given board state
         '''
-        current_board_states = board_states
-        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = current_board_states
-        player_pos = np.argwhere(entity_board == player_id)[0]
-        player_meta_idx = np.argwhere(player_meta[:, 0] == player_id).item()
-        # check actions
-        actions = []
-        for a in list(Actions):
-            # direction actions
-            if a.value in [Actions.UP.value, Actions.DOWN.value, Actions.LEFT.value, Actions.RIGHT.value]:
-                new_pos = player_pos + self.action_direction[a.value]
-                py, px = new_pos
-                # make sure new_pos is in bounds
-                valid_bounds = np.all(new_pos >= 0) and np.all(new_pos < entity_board.shape[0])
-                if valid_bounds:
-                    valid_move = entity_board[py, px] == 0 and bombs_board[py, px] == 0
-                    if valid_move:
-                        actions.append(a.value)
-            # bomb and detonation and check if player has enough ammo to place bomb
-            if a.value in [Actions.BOMB.value]:
-                py, px = player_pos
-                valid_move = bombs_board[py, px] == 0 and player_meta[player_meta_idx, 2] > 0
-                if valid_move:
-                    actions.append(a.value)
-        
-        actions.append(Actions.NONE.value)
-
-        return actions
+        return mask_to_actions(self.legal_action_mask(player_id, board_states))
 
     
     def add_bomb_to_board(self, board, pos, meta):
@@ -177,42 +247,352 @@ class BMBoard:
 
     
     def player_meta_to_dict(self, meta):
-        id, hp, ammo, power = meta
+        id, hp, ammo, power, y, x = meta
         meta_dict = {
             'id': id,
             'hp':hp,
             'ammo':ammo,
-            'power':power
+            'power':power,
+            'pos':(y, x)
         }
         return meta_dict
 
 
-    def add_bomb(self, board, pos, entity_board, player_meta):
+    def _write(self, record, layer, y, x, value):
         '''
-        add bomb to bomb board at position
-        requires entity_board to check for blocks and players
-        requires player_meta to register ammo changes
+        set layer[y, x] to value, appending the overwritten cell to record when recording
+        '''
+        if record != None:
+            record.append((layer, y, x, layer[y, x]))
+        layer[y, x] = value
+
+
+    def _place_bomb(self, board, pos, entity_board, player_meta, record=None):
+        '''
+        in place version of add_bomb
         '''
-        board = board.copy()
-        player_meta = player_meta.copy()
         y, x = pos
 
         # ensure not placed ontop of another bomb
         if board[y,x] != 0:
-            return board, player_meta
+            return
 
-        board[y, x] = self._bomb_life
+        self._write(record, board, y, x, self._bomb_life)
 
         # decrease ammo
         if np.isin(entity_board[y, x], self._players):
             # which idx in player meta?
-            p = entity_board[y, x]
-            pm_idx = np.argwhere(player_meta[:,0] == p).ravel()[0]
+            pm_idx = self._meta_rows[entity_board[y, x]]
             # apply ammo change
-            player_meta[pm_idx, 2] -= 1
+            self._write(record, player_meta, pm_idx, 2, player_meta[pm_idx, 2] - 1)
+
+
+    def _blast_rays(self, y, x, power):
+        '''
+        cells covered by each of the 4 rays of a blast at (y, x), rays end at the board edge
+        '''
+        key = (y, x, power)
+        if key not in self._rays:
+            rays = []
+            for dy, dx in self.action_direction:
+                ray = []
+                for p in range(1, power):
+                    ry, rx = y + dy*p, x + dx*p
+                    if ry < 0 or rx < 0 or ry >= self.board_width or rx >= self.board_width:
+                        break
+                    ray.append((ry, rx))
+                rays.append(tuple(ray))
+            self._rays[key] = tuple(rays)
+        return self._rays[key]
+
+
+    def _blast_cells(self, y, x, entity_board, power):
+        '''
+        cells a bomb exploding at (y, x) sets on fire, the centre first
+        '''
+        cells = [(y, x)]
+        block = Entities.BLOCK.value
+        # add fire entity in 4 directions from the center
+        for ray in self._blast_rays(y, x, power):
+            # propagate the fire radius based on power
+            for dy, dx in ray:
+                # stop propagating if hit block
+                if entity_board[dy, dx] == block:
+                    break
+                cells.append((dy, dx))
+        return cells
+
+
+    def _ignite(self, board, pos, entity_board, record=None):
+        '''
+        in place version of add_fire, returns the cells set on fire
+        '''
+        power = 2
+        cells = self._blast_cells(int(pos[0]), int(pos[1]), entity_board, power)
+        for y, x in cells:
+            self._write(record, board, y, x, self._fire_life)
+        return cells
+
+
+    def _bomb_timers(self, board_states):
+        '''
+        {(y, x): timer} of every bomb in board_states
+        '''
+        bombs_board = board_states[1]
+        ys, xs = np.nonzero(bombs_board)
+        return dict(zip(zip(ys.tolist(), xs.tolist()), bombs_board[ys, xs].tolist()))
+
+
+    def _timers_at(self, board_states, y, x):
+        '''
+        (bomb timer, fire timer) at cell (y, x) of board_states, 0 where there is none
+        '''
+        return board_states[1][y, x], board_states[2][y, x]
+
+
+    def _cell_at(self, board_states, y, x):
+        '''
+        (blocked, fire timer) at cell (y, x) of board_states, a cell is blocked by any entity or a bomb
+        '''
+        return board_states[0][y, x] != 0 or board_states[1][y, x] > 0, int(board_states[2][y, x])
+
+
+    def _entity_board(self, board_states):
+        '''
+        entity board of board_states, blasts stop at its blocks
+        '''
+        return board_states[0]
+
+
+    def bomb_fuses(self, board_states):
+        '''
+        {(y, x): ticks until the bomb goes off} of every bomb in board_states, computed from scratch.
+        bombs whose blasts reach each other chain, so each goes off with the earliest bomb it is connected to
+        '''
+        fuses = self._bomb_timers(board_states)
+        return self._chain(fuses, list(fuses), self._entity_board(board_states))
+
+
+    def next_bomb_fuses(self, fuses, board_states, timers=None):
+        '''
+        bomb_fuses of board_states given the bomb_fuses of the state one step earlier.
+        timers are the bomb timers of board_states if the caller already has them.
+        every bomb still on the board is a tick closer, only the chains through the bombs placed in the step
+        are followed again. a new bomb can join an older chain, or link two and bring the later one forward
+        '''
+        next_fuses = {}
+        new_bombs = []
+        if timers == None:
+            timers = self._bomb_timers(board_states)
+        for b, timer in timers.items():
+            if b in fuses:
+                next_fuses[b] = fuses[b] - 1
+            else:
+                next_fuses[b] = timer
+                new_bombs.append(b)
+        if len(new_bombs) == 0:
+            return next_fuses
+        return self._chain(next_fuses, new_bombs, self._entity_board(board_states))
+
+
+    def _chain(self, fuses, pending, entity_board):
+        '''
+        settle fuses in place starting from the bombs in pending, every bomb a blast reaches gets its fuse
+        if it is earlier. blasts reach each other both ways, so a bomb also takes an earlier fuse it reaches
+        '''
+        power = 2
+        while len(pending) > 0:
+            b = pending.pop()
+            for cell in self._blast_cells(b[0], b[1], entity_board, power):
+                if cell not in fuses:
+                    continue
+                if fuses[cell] > fuses[b]:
+                    fuses[cell] = fuses[b]
+                    pending.append(cell)
+                elif fuses[cell] < fuses[b]:
+                    fuses[b] = fuses[cell]
+                    pending.append(b)
+        return fuses
+
+
+    def danger_map(self, board_states, fuses=None):
+        '''
+        ticks until a pending blast reaches each cell, from the bomb_fuses of board_states (computed if not given).
+        t for cells caught by a bomb that goes off in t steps and 0 for cells no pending blast reaches,
+        a cell under several blasts gets the earliest. cells burning now are the ones set in fire_board
+        '''
+        if fuses == None:
+            fuses = self.bomb_fuses(board_states)
+        return self._danger(fuses, self._entity_board(board_states))
+
+
+    def _danger(self, fuses, entity_board):
+        danger = np.zeros(self.board_width**2, dtype=np.int32)
+        for c, fuse in self._danger_cells(fuses, entity_board).items():
+            danger[c] = fuse
+        return danger.reshape(self.board_shape)
+
+
+    def _danger_cells(self, fuses, entity_board):
+        '''
+        {flat cell: ticks until the earliest pending blast reaches it} of the cells the blasts of fuses reach
+        '''
+        power = 2
+        danger = {}
+        for (y, x), fuse in fuses.items():
+            for by, bx in self._blast_cells(y, x, entity_board, power):
+                c = by*self.board_width + bx
+                if danger.get(c, fuse + 1) > fuse:
+                    danger[c] = fuse
+        return danger
+
+
+    def exposure(self, player_id, board_states, fuses=None):
+        '''
+        0 to 1, how soon the cell of player_id burns. 1 for fire or a blast on the next tick, less for blasts
+        with more time left and 0 if no pending blast reaches the cell. fuses is the bomb_fuses of board_states,
+        computed if not given, so a bomb chained to an earlier one counts with the earlier fuse
+        '''
+        pm_idx = self._meta_rows[player_id]
+        y, x = int(board_states[5][pm_idx, 4]), int(board_states[5][pm_idx, 5])
+        if self._timers_at(board_states, y, x)[1] > 0:
+            return 1.0
+        if fuses == None:
+            fuses = self.bomb_fuses(board_states)
+        fuse = self._danger_cells(fuses, self._entity_board(board_states)).get(y*self.board_width + x, 0)
+        if fuse == 0:
+            return 0.0
+        return 1 - (fuse - 1)/self._bomb_life
+
+
+    def safe_action_mask(self, player_id, board_states, fuses=None, legal_mask=None):
+        '''
+        legal_action_mask without the actions that leave player_id somewhere it cannot get clear of fire and
+        pending blasts in time. fuses is the bomb_fuses of board_states, computed if not given.
+        the other player is assumed to stay put, if no action is safe the legal mask is returned unchanged.
+        only the cells the player can reach before the last pending blast is over are looked at
+        '''
+        if legal_mask == None:
+            legal_mask = self.legal_action_mask(player_id, board_states)
+        is_safe = self._safety(player_id, board_states, fuses)
+        safe = 0
+        for a in mask_to_actions(legal_mask):
+            if is_safe(a):
+                safe |= 1 << a
+        return safe if safe != 0 else legal_mask
+
+
+    def random_safe_action(self, player_id, board_states, index, fuses=None):
+        '''
+        a uniformly random action of safe_action_mask, index(n) draws a random int below n (e.g. RandomBuffer.index).
+        legal actions are checked in random order until one is safe, so most calls check a single action
+        '''
+        actions = mask_to_actions(self.legal_action_mask(player_id, board_states))
+        is_safe = self._safety(player_id, board_states, fuses)
+        remaining = list(actions)
+        while len(remaining) > 0:
+            a = remaining.pop(index(len(remaining)))
+            if is_safe(a):
+                return a
+        return actions[index(len(actions))]
 
-        return board, player_meta        
 
+    def _safety(self, player_id, board_states, fuses=None):
+        '''
+        is_safe(action) for player_id in board_states, see safe_action_mask
+        '''
+        if fuses == None:
+            fuses = self.bomb_fuses(board_states)
+        entity_board = self._entity_board(board_states)
+        pm_idx = self._meta_rows[player_id]
+        cell = int(board_states[5][pm_idx, 4])*self.board_width + int(board_states[5][pm_idx, 5])
+
+        # (blocked, fire timer) of the cells looked at and survivable (cell, step), shared by the actions
+        cells = {}
+        memo = {}
+        danger = self._danger_cells(fuses, entity_board)
+        bomb_action, none_action = Actions.BOMB.value, Actions.NONE.value
+
+        def is_safe(a):
+            if a != bomb_action:
+                target = cell if a == none_action else self._neighbor_cells[cell][a]
+                return self._escapes(target, board_states, danger, cells, memo)
+            # the new bomb goes off bomb_life steps from now unless it joins an earlier chain,
+            # it can also link chains and bring a later one forward. fuses only get earlier,
+            # so only the blasts of the bombs whose fuse changed are added to danger
+            bomb = divmod(cell, self.board_width)
+            bomb_fuses = dict(fuses)
+            bomb_fuses[bomb] = self._bomb_life
+            self._chain(bomb_fuses, [bomb], entity_board)
+            changed = {b: f for b, f in bomb_fuses.items() if fuses.get(b) != f}
+            bomb_danger = dict(danger)
+            for c, f in self._danger_cells(changed, entity_board).items():
+                if bomb_danger.get(c, f + 1) > f:
+                    bomb_danger[c] = f
+            return self._escapes(cell, board_states, bomb_danger, cells, {})
+        return is_safe
+
+
+    def _escapes(self, start, board_states, danger, cells, memo):
+        '''
+        whether a player standing on flat cell start after the next step can keep out of fire until
+        every pending blast is over. danger is _danger_cells, cells keeps the (blocked, fire timer) of each
+        flat cell looked at. memo keeps which (cell, step) the player survives from, calls with the same
+        danger can share it
+        '''
+        w = self.board_width
+        life = self._bomb_life
+        neighbors = self._neighbor_cells
+
+        def look(c):
+            info = cells.get(c)
+            if info == None:
+                info = cells[c] = self._cell_at(board_states, c//w, c % w)
+            return info
+
+        # a player on c at step t is safe from then on if it can keep off burning cells, a cell burns on
+        # the steps its fire has left and on the step its blast goes off and the one after
+        def survives(c, t):
+            key = (c, t)
+            safe = memo.get(key)
+            if safe != None:
+                return safe
+            d = danger.get(c, 0)
+            # nothing left to burn this cell, or every pending blast is over
+            safe = t > life or ((d == 0 or d + 1 <= t) and look(c)[1] <= t)
+            if not safe:
+                for n in (c, *neighbors[c]):
+                    if n < 0:
+                        continue
+                    blocked, fire = look(n)
+                    if n != c and blocked:
+                        continue
+                    d = danger.get(n, 0)
+                    if t + 1 <= fire or 0 < d <= t + 1 <= d + 1:
+                        continue
+                    if survives(n, t + 1):
+                        safe = True
+                        break
+            memo[key] = safe
+            return safe
+
+        d = danger.get(start, 0)
+        # most cells are out of reach of every fire and blast
+        if d == 0 and look(start)[1] == 0:
+            return True
+        return d != 1 and look(start)[1] == 0 and survives(start, 1)
+
+
+    def add_bomb(self, board, pos, entity_board, player_meta):
+        '''
+        add bomb to bomb board at position
+        requires entity_board to check for blocks and players
+        requires player_meta to register ammo changes
+        '''
+        board = board.copy()
+        player_meta = player_meta.copy()
+        self._place_bomb(board, pos, entity_board, player_meta)
+        return board, player_meta
 
 
     def add_fire(self, board, pos, entity_board, player_meta):
@@ -221,54 +601,27 @@ class BMBoard:
         requires entity_board to check for blocks and players
         requires player_meta to register damage
         '''
-        power = 2
         board = board.copy()
         player_meta = player_meta.copy()
-        y, x = pos
-        board[y, x] = self._fire_life
-        # add fire entity in 4 directions from the center
-        for dir in np.array(self.action_direction):
-            # propagate the fire radius based on power
-            for p in range(1, power):
-                dy, dx = np.clip(pos + dir*p, a_min=0, a_max=self.board_width-1)
-                # stop propagating if hit block
-                if entity_board[dy, dx] == Entities.BLOCK.value:
-                    break
-                else:
-                    board[dy, dx] = self._fire_life
-
+        self._ignite(board, pos, entity_board)
         return board, player_meta
 
 
-    def step(self, actions, simulate=False, prev_board=None, prev_bombs=None, prev_fire=None, prev_ammo=None, prev_powerup=None, prev_player_meta=None):
+    def _advance(self, actions, board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done, record=None, live=None):
         '''
-        apply supplied actions to a board state.
-        actions are defined as a list of tuples, [(player_id, action_id), ...]
+        apply actions to the given layers in place and return the new done flag.
+        with a record list every overwritten cell is appended to it so the tick can be undone.
+        live is an optional (bomb cells, fire cells) pair of sets that is kept up to date in place, bombs
+        and fire are then visited from it instead of scanning the layers
         '''
-        if simulate == False:
-            board = self.board.copy()
-            bombs_board = self.bombs_board.copy()
-            fire_board = self.fire_board.copy()
-            ammo_board = self.ammo_board.copy()
-            powerup_board = self.powerup_board.copy()
-            player_meta = self.player_meta.copy()
-        else:
-            board = prev_board.copy()
-            bombs_board = prev_bombs.copy()
-            fire_board = prev_fire.copy()
-            ammo_board = prev_ammo.copy()
-            powerup_board = prev_powerup.copy()
-            player_meta = prev_player_meta.copy()
-
-        done = self.done
-
         # apply actions to layers
         for i, pa in enumerate(actions):
             # player id, action value
             p, a = pa
 
-            p_ammo = player_meta[player_meta[:, 0] == p, 2][0]
-            p_currpos = np.argwhere(board == p)[0]
+            pm_idx = self._meta_rows[p]
+            p_ammo = player_meta[pm_idx, 2]
+            py, px = player_meta[pm_idx, 4], player_meta[pm_idx, 5]
 
             # handle none
             if a == Actions.NONE.value:
@@ -278,60 +631,97 @@ class BMBoard:
             if a == Actions.BOMB.value:
                 if p_ammo <= 0:
                     continue
-                bombs_board, player_meta = self.add_bomb(bombs_board, p_currpos, board, player_meta)
+                self._place_bomb(bombs_board, (py, px), board, player_meta, record)
+                if live != None:
+                    live[0].add((int(py), int(px)))
                 continue
             
             # bounded proposed new pos
-            p_newpos = np.clip(p_currpos + self.action_direction[a], a_min=0, a_max=self.board_width-1)
+            dy, dx = self.action_direction[a]
+            ny = min(max(py + dy, 0), self.board_width-1)
+            nx = min(max(px + dx, 0), self.board_width-1)
             
-            # apply movement to player board
-            if board[p_newpos[0], p_newpos[1]] == 0 and bombs_board[p_newpos[0], p_newpos[1]] == 0:
-                board[p_currpos[0], p_currpos[1]] = 0
-                board[p_newpos[0], p_newpos[1]] = p
+            # apply movement to player board and player_meta
+            if board[ny, nx] == 0 and bombs_board[ny, nx] == 0:
+                self._write(record, board, py, px, 0)
+                self._write(record, board, ny, nx, p)
+                self._write(record, player_meta, pm_idx, 4, ny)
+                self._write(record, player_meta, pm_idx, 5, nx)
 
         # tick bombs
-        active_bombs = np.argwhere(bombs_board > 0)
+        active_bombs = np.argwhere(bombs_board > 0) if live == None else list(live[0])
         for ab in active_bombs:
-            bombs_board[ab[0], ab[1]] -= 1
+            self._write(record, bombs_board, ab[0], ab[1], bombs_board[ab[0], ab[1]] - 1)
             # explode bombs
             if bombs_board[ab[0], ab[1]] == 0:
                 # add fire
-                fire_board, player_meta = self.add_fire(fire_board, ab, board, player_meta)
+                cells = self._ignite(fire_board, ab, board, record)
+                if live != None:
+                    live[0].discard(ab)
+                    live[1].update(cells)
 
         
-        # chain bombs
-        active_fire = np.argwhere(fire_board > 0)
-        bi = 0
-        while bi < len(active_fire):
-            af = active_fire[bi]
-            afy, afx = af
-            if bombs_board[afy, afx] > 0:
-                bombs_board[afy, afx] = 0
-                fire_board, player_meta = self.add_fire(fire_board, af, board, player_meta)
-            active_fire = np.argwhere(fire_board > 0)
-            bi += 1
+        # chain bombs, every bomb standing in fire detonates and so do the bombs its blast reaches
+        if live == None:
+            detonating = [(by, bx) for by, bx in np.argwhere((bombs_board > 0) & (fire_board > 0))]
+        else:
+            detonating = [b for b in live[0] if fire_board[b] > 0]
+        while len(detonating) > 0:
+            by, bx = detonating.pop()
+            if bombs_board[by, bx] == 0:
+                continue
+            self._write(record, bombs_board, by, bx, 0)
+            cells = self._ignite(fire_board, (by, bx), board, record)
+            if live != None:
+                live[0].discard((by, bx))
+                live[1].update(cells)
+            for fy, fx in cells:
+                if bombs_board[fy, fx] > 0:
+                    detonating.append((fy, fx))
         
         
-        # tick fire
-        active_fire = np.argwhere(fire_board > 0)
-        for af in active_fire:
-            afy, afx = af
-
-            # apply damage to players
-            if np.isin(board[afy, afx], self._players):
-                # which idx in player meta?
-                p = board[afy, afx]
-                pm_idx = np.argwhere(player_meta[:,0] == p).ravel()[0]
-                # apply damage
-                player_meta[pm_idx, 1] -= 1
+        # apply damage to players standing in fire
+        for pm_idx in self._meta_rows.values():
+            if fire_board[player_meta[pm_idx, 4], player_meta[pm_idx, 5]] > 0:
+                self._write(record, player_meta, pm_idx, 1, player_meta[pm_idx, 1] - 1)
 
-            fire_board[afy, afx] -= 1
+        # tick fire
+        active_fire = np.argwhere(fire_board > 0) if live == None else list(live[1])
+        for afy, afx in active_fire:
+            self._write(record, fire_board, afy, afx, fire_board[afy, afx] - 1)
+            if live != None and fire_board[afy, afx] == 0:
+                live[1].discard((afy, afx))
 
         # check if any players have lost
         dead_players = player_meta[player_meta[:, 1] <= 0, 0]
         if len(dead_players) > 0:
             done = True
 
+        return done
+
+
+    def step(self, actions, simulate=False, prev_board=None, prev_bombs=None, prev_fire=None, prev_ammo=None, prev_powerup=None, prev_player_meta=None):
+        '''
+        apply supplied actions to a board state.
+        actions are defined as a list of tuples, [(player_id, action_id), ...]
+        '''
+        if simulate == False:
+            board = self.board.copy()
+            bombs_board = self.bombs_board.copy()
+            fire_board = self.fire_board.copy()
+            ammo_board = self.ammo_board.copy()
+            powerup_board = self.powerup_board.copy()
+            player_meta = self.player_meta.copy()
+        else:
+            board = prev_board.copy()
+            bombs_board = prev_bombs.copy()
+            fire_board = prev_fire.copy()
+            ammo_board = prev_ammo.copy()
+            powerup_board = prev_powerup.copy()
+            player_meta = prev_player_meta.copy()
+
+        done = self._advance(actions, board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, self.done)
+
         # modify internal board states if not simulating, otherwise return the modified board states
         if simulate == False:
             self.board = board
@@ -341,5 +731,138 @@ class BMBoard:
             self.powerup_board = powerup_board
             self.player_meta = player_meta
             self.done = done
+            self.fuses = self.next_bomb_fuses(self.fuses, self.board_state)
+            self._danger_board = None
+            self._live = None
+            # the internal arrays were replaced, earlier undo records no longer apply
+            self._undo_stack = []
         else:
             return board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done
+
+
+    def step_changes(self, actions, board_states):
+        '''
+        step in simulate mode from board_states that also returns the board cells it changed,
+        (new board state, [(layer, y, x, old value, new value), ...]) with layer 0-4 the index of a board layer.
+        the cells come from the undo record of the step, so no layer is compared
+        '''
+        layers = [layer.copy() for layer in board_states[:5]]
+        player_meta = board_states[5].copy()
+        record = []
+        done = self._advance(actions, *layers, player_meta, self.done, record)
+
+        old = {}
+        index = {id(layer): i for i, layer in enumerate(layers)}
+        for layer, y, x, value in record:
+            if layer is not player_meta:
+                old.setdefault((index[id(layer)], y, x), value)
+        changes = [(i, y, x, int(value), int(layers[i][y, x])) for (i, y, x), value in old.items() if value != layers[i][y, x]]
+        return (*layers, player_meta, done), changes
+
+
+    def apply(self, actions):
+        '''
+        apply actions to the internal board state in place, without copying or scanning any layer,
+        and push a record of the overwritten cells so undo can revert it
+        '''
+        if self._live == None:
+            self._live = (set(self._bomb_timers(self.board_state)), set(zip(*(idx.tolist() for idx in np.nonzero(self.fire_board)))))
+        record = []
+        done = self.done
+        fuses, danger_board = self.fuses, self._danger_board
+        live = (set(self._live[0]), set(self._live[1]))
+        self.done = self._advance(actions, self.board, self.bombs_board, self.fire_board, self.ammo_board,
+                                  self.powerup_board, self.player_meta, done, record, self._live)
+        timers = {b: int(self.bombs_board[b]) for b in self._live[0]}
+        self.fuses = self.next_bomb_fuses(fuses, self.board_state, timers)
+        self._danger_board = None
+        self._undo_stack.append((record, done, fuses, danger_board, live))
+
+
+    def undo(self):
+        '''
+        revert the most recent apply
+        '''
+        record, done, self.fuses, self._danger_board, self._live = self._undo_stack.pop()
+        for layer, y, x, value in reversed(record):
+            layer[y, x] = value
+        self.done = done
+
+
+    def scratch_board(self, board_states):
+        '''
+        board with the same settings whose internal state is board_states itself, not a copy, for walking a
+        line of play with apply and undo. the same board is handed out on every call, undo every apply
+        before board_states is used anywhere else
+        '''
+        if self._scratch == None:
+            self._scratch = copy(self)
+        scratch = self._scratch
+        scratch.board, scratch.bombs_board, scratch.fire_board, scratch.ammo_board, scratch.powerup_board, scratch.player_meta, scratch.done = board_states
+        scratch.fuses = self.bomb_fuses(board_states)
+        scratch._danger_board = None
+        scratch._live = None
+        scratch._undo_stack = []
+        return scratch
+
+
+class PackedBMBoard(BMBoard):
+    '''
+    base of the engines that keep the board state in another layout (BitBoard, SparseBMBoard).
+    subclasses convert with pack_board_state / unpack_board_state and their steps never modify the layers
+    of the state they start from, so apply keeps the previous board state as its undo record
+    '''
+    def __repr__(self):
+        board, bombs_board, fire_board = self.unpack_board_state(self.board_state)[:3]
+        return str(board + bombs_board + fire_board)
+
+    def render(self, boards=None):
+        if boards == None:
+            boards = self.board_state
+        super().render(self.unpack_board_state(boards)[:3])
+
+
+    def restart_board(self):
+        '''
+        restart a board, then convert its layers
+        '''
+        packed = self.pack_board_state(super().restart_board())
+        self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done = packed
+        return packed
+
+
+    def pack_board_state(self, board_states):
+        '''
+        convert a BMBoard board state into this engine's layout
+        '''
+        raise NotImplementedError
+
+    def unpack_board_state(self, board_states):
+        '''
+        convert a board state of this engine back into BMBoard arrays
+        '''
+        raise NotImplementedError
+
+
+    def step_changes(self, actions, board_states):
+        '''
+        step in simulate mode from board_states that also returns the board cells it changed, as BMBoard.step_changes
+        with the values the cells have in the unpacked layers. subclasses find them without unpacking
+        '''
+        raise NotImplementedError
+
+
+    def apply(self, actions):
+        '''
+        apply actions to the internal board state, the undo record is the previous board state and its fuses
+        '''
+        self._undo_stack.append((self.board_state, self.fuses, self._danger_board))
+        self.step(actions)
+
+
+    def undo(self):
+        '''
+        revert the most recent apply
+        '''
+        board_state, self.fuses, self._danger_board = self._undo_stack.pop()
+        self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done = board_state
@@ -0,0 +1,305 @@
+import numpy as np
+from bm import PackedBMBoard, Actions, Entities
+
+
+_UP = Actions.UP.value
+_DOWN = Actions.DOWN.value
+_LEFT = Actions.LEFT.value
+_RIGHT = Actions.RIGHT.value
+_BOMB = Actions.BOMB.value
+_NONE = Actions.NONE.value
+
+
+class BitBoard(PackedBMBoard):
+    '''
+    BMBoard with every layer packed into python int bitmasks, cell (y, x) is bit y*board_width + x
+
+    board: (blocks, p1, p2) masks, indexed by entity value
+    bombs_board, fire_board: tuples of timer bit-planes, lowest bit first
+    ammo_board, powerup_board: occupancy masks
+    '''
+    def __init__(self, board_width=9, start_health=3, start_ammo=3):
+        n_cells = board_width**2
+        first_col = sum(1 << (y*board_width) for y in range(board_width))
+        self._full = (1 << n_cells) - 1
+        self._not_first_col = self._full & ~first_col
+        self._not_last_col = self._full & ~(first_col << (board_width-1))
+        self._blocks = None
+        super().__init__(board_width, start_health, start_ammo)
+
+
+    def _pack(self, mask):
+        return int.from_bytes(np.packbits(mask.ravel(), bitorder='little').tobytes(), 'little')
+
+    def _unpack(self, bits):
+        n_cells = self.board_width**2
+        raw = np.frombuffer(bits.to_bytes((n_cells + 7)//8, 'little'), dtype=np.uint8)
+        return np.unpackbits(raw, count=n_cells, bitorder='little').reshape(self.board_shape).astype(np.int32)
+
+
+    def pack_board_state(self, board_states):
+        '''
+        convert a BMBoard board state into its packed form
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        board = (
+            self._pack(entity_board == Entities.BLOCK.value),
+            self._pack(entity_board == Entities.P1.value),
+            self._pack(entity_board == Entities.P2.value)
+        )
+        bombs = tuple(self._pack((bombs_board >> i) & 1 == 1) for i in range(self._bomb_life.bit_length()))
+        fire = tuple(self._pack((fire_board >> i) & 1 == 1) for i in range(self._fire_life.bit_length()))
+        return board, bombs, fire, self._pack(ammo_board > 0), self._pack(powerup_board > 0), player_meta.copy(), done
+
+    def unpack_board_state(self, board_states):
+        '''
+        convert a packed board state back into BMBoard arrays
+        '''
+        board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        blocks, p1, p2 = board
+        entity_board = (
+            self._unpack(blocks)*Entities.BLOCK.value
+            + self._unpack(p1)*Entities.P1.value
+            + self._unpack(p2)*Entities.P2.value
+        )
+        bombs = sum(self._unpack(plane) << i for i, plane in enumerate(bombs_board))
+        fire = sum(self._unpack(plane) << i for i, plane in enumerate(fire_board))
+        return entity_board, bombs, fire, self._unpack(ammo_board), self._unpack(powerup_board), player_meta.copy(), done
+
+
+    def _shift(self, bits, direction):
+        '''
+        move every set bit one cell in direction, bits leaving the board are dropped
+        '''
+        if direction == _UP:
+            return bits >> self.board_width
+        if direction == _DOWN:
+            return (bits << self.board_width) & self._full
+        if direction == _LEFT:
+            return (bits >> 1) & self._not_last_col
+        return (bits << 1) & self._not_first_col
+
+
+    def _blast(self, centres, blocks):
+        '''
+        cells covered by the explosions of all bombs in centres
+        '''
+        power = 2
+        open_cells = self._full & ~blocks
+        fire = centres
+        for direction in (_UP, _DOWN, _LEFT, _RIGHT):
+            ray = centres
+            # propagate the fire radius based on power, stop propagating if hit block
+            for _ in range(1, power):
+                ray = self._shift(ray, direction) & open_cells
+                fire |= ray
+        return fire
+
+
+    def _set_timer(self, planes, mask, value):
+        for i in range(len(planes)):
+            if (value >> i) & 1:
+                planes[i] |= mask
+            else:
+                planes[i] &= ~mask
+
+    def _tick_timer(self, planes, mask):
+        '''
+        decrement the timers under mask by one, returns the mask of timers that are still running
+        '''
+        borrow = mask
+        running = 0
+        for i in range(len(planes)):
+            plane = planes[i]
+            planes[i] = plane ^ borrow
+            borrow &= ~plane
+            running |= planes[i]
+        return running
+
+
+    def legal_action_mask(self, player_id, board_states):
+        '''
+        legal actions of player_id in the given board state as an int mask, bit a is set when action value a is legal
+        '''
+        board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        blocks, p1, p2 = board
+        player_pos = board[player_id]
+        bombs = 0
+        for plane in bombs_board:
+            bombs |= plane
+        blocked = blocks | p1 | p2 | bombs
+
+        mask = 1 << _NONE
+        for a in (_UP, _DOWN, _LEFT, _RIGHT):
+            new_pos = self._shift(player_pos, a)
+            if new_pos and not new_pos & blocked:
+                mask |= 1 << a
+        if not player_pos & bombs and player_meta[self._meta_rows[player_id], 2] > 0:
+            mask |= 1 << _BOMB
+        return mask
+
+
+    def _bomb_timers(self, board_states):
+        bomb_planes = board_states[1]
+        bombs = 0
+        for plane in bomb_planes:
+            bombs |= plane
+        timers = {}
+        while bombs:
+            bit = bombs & -bombs
+            timers[divmod(bit.bit_length() - 1, self.board_width)] = sum(1 << i for i, plane in enumerate(bomb_planes) if plane & bit)
+            bombs ^= bit
+        return timers
+
+    def _timers_at(self, board_states, y, x):
+        shift = y*self.board_width + x
+        return tuple(sum(((plane >> shift) & 1) << i for i, plane in enumerate(planes)) for planes in board_states[1:3])
+
+    def _cell_at(self, board_states, y, x):
+        shift = y*self.board_width + x
+        blocked = False
+        for bits in (*board_states[0], *board_states[1]):
+            if (bits >> shift) & 1:
+                blocked = True
+                break
+        fire = 0
+        for i, plane in enumerate(board_states[2]):
+            fire |= ((plane >> shift) & 1) << i
+        return blocked, fire
+
+    def _entity_board(self, board_states):
+        # blocks never move, the unpacked board is kept for the last blocks mask seen
+        blocks = board_states[0][0]
+        if self._blocks == None or self._blocks[0] != blocks:
+            self._blocks = (blocks, self._unpack(blocks)*Entities.BLOCK.value)
+        return self._blocks[1]
+
+
+    def _bit_value(self, planes, bit):
+        return sum(1 << i for i, plane in enumerate(planes) if plane & bit)
+
+    def _entity_value(self, board, bit):
+        if board[0] & bit:
+            return Entities.BLOCK.value
+        return Entities.P1.value if board[1] & bit else Entities.P2.value if board[2] & bit else 0
+
+    def step_changes(self, actions, board_states):
+        new_states = self.step(actions, True, *board_states[:-1])
+        changes = []
+        for layer in range(3):
+            prev, planes = board_states[layer], new_states[layer]
+            changed = 0
+            for prev_plane, plane in zip(prev, planes):
+                changed |= prev_plane ^ plane
+            value = self._entity_value if layer == 0 else self._bit_value
+            while changed:
+                bit = changed & -changed
+                changed ^= bit
+                y, x = divmod(bit.bit_length() - 1, self.board_width)
+                changes.append((layer, y, x, value(prev, bit), value(planes, bit)))
+        return new_states, changes
+
+
+    def step(self, actions, simulate=False, prev_board=None, prev_bombs=None, prev_fire=None, prev_ammo=None, prev_powerup=None, prev_player_meta=None):
+        '''
+        apply supplied actions to a board state.
+        actions are defined as a list of tuples, [(player_id, action_id), ...]
+        '''
+        if simulate == False:
+            board = self.board
+            bomb_planes = list(self.bombs_board)
+            fire_planes = list(self.fire_board)
+            ammo_board = self.ammo_board
+            powerup_board = self.powerup_board
+            player_meta = self.player_meta.copy()
+        else:
+            board = prev_board
+            bomb_planes = list(prev_bombs)
+            fire_planes = list(prev_fire)
+            ammo_board = prev_ammo
+            powerup_board = prev_powerup
+            player_meta = prev_player_meta.copy()
+
+        done = self.done
+
+        board = list(board)
+        bombs = 0
+        for plane in bomb_planes:
+            bombs |= plane
+
+        # apply actions to layers
+        for p, a in actions:
+            p_currpos = board[p]
+
+            # handle none
+            if a == _NONE:
+                continue
+
+            # handle bombs, ensure not placed ontop of another bomb
+            if a == _BOMB:
+                pm_idx = self._meta_rows[p]
+                if player_meta[pm_idx, 2] <= 0 or p_currpos & bombs:
+                    continue
+                self._set_timer(bomb_planes, p_currpos, self._bomb_life)
+                bombs |= p_currpos
+                player_meta[pm_idx, 2] -= 1
+                continue
+
+            # apply movement, moves off the board leave the player in place
+            p_newpos = self._shift(p_currpos, a)
+            if p_newpos and not p_newpos & (board[0] | board[1] | board[2] | bombs):
+                board[p] = p_newpos
+                player_meta[self._meta_rows[p], 4:6] = divmod(p_newpos.bit_length() - 1, self.board_width)
+
+        blocks = board[0]
+
+        # tick bombs and explode the ones that run out
+        remaining = self._tick_timer(bomb_planes, bombs)
+        exploding = bombs & ~remaining
+        bombs = remaining
+        if exploding:
+            self._set_timer(fire_planes, self._blast(exploding, blocks), self._fire_life)
+
+        # chain bombs
+        burning = 0
+        for plane in fire_planes:
+            burning |= plane
+        chained = bombs & burning
+        while chained:
+            for i in range(len(bomb_planes)):
+                bomb_planes[i] &= ~chained
+            bombs &= ~chained
+            new_fire = self._blast(chained, blocks)
+            self._set_timer(fire_planes, new_fire, self._fire_life)
+            burning |= new_fire
+            chained = bombs & new_fire
+
+        # apply damage to players standing in fire
+        for p, pm_idx in self._meta_rows.items():
+            if board[p] & burning:
+                player_meta[pm_idx, 1] -= 1
+
+        # tick fire
+        self._tick_timer(fire_planes, burning)
+
+        # check if any players have lost
+        if np.any(player_meta[:, 1] <= 0):
+            done = True
+
+        board = tuple(board)
+        bombs_board = tuple(bomb_planes)
+        fire_board = tuple(fire_planes)
+
+        # modify internal board states if not simulating, otherwise return the modified board states
+        if simulate == False:
+            self.board = board
+            self.bombs_board = bombs_board
+            self.fire_board = fire_board
+            self.ammo_board = ammo_board
+            self.powerup_board = powerup_board
+            self.player_meta = player_meta
+            self.done = done
+            self.fuses = self.next_bomb_fuses(self.fuses, self.board_state)
+            self._danger_board = None
+        else:
+            return board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done
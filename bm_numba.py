@@ -1,6 +1,7 @@
 import numpy as np
 from enum import IntEnum
 from copy import deepcopy
+import time
 import numba
 
 class Actions(IntEnum):
@@ -12,6 +13,10 @@ class Actions(IntEnum):
     #DETONATE = 5
     NONE = 6
 
+# timers in ticks
+BOMB_LIFE = 4
+FIRE_LIFE = 2
+
 class Entities(IntEnum):
     FLOOR = 0
     P1 = 1
@@ -22,34 +27,234 @@ class Entities(IntEnum):
     AMMO = 6
     POWERUP = 7
 
-@numba.extending.overload(np.clip)
-def np_clip(a, a_min, a_max, out=None):
-    def np_clip_impl(a, a_min, a_max, out=None):
-        if out is None:
-            out = np.empty_like(a)
-        for i in np.arange(len(a)):
-            if a[i] < a_min:
-                out[i] = a_min
-            elif a[i] > a_max:
-                out[i] = a_max
-            else:
-                out[i] = a[i]
-        return out
-    return np_clip_impl
-
-@numba.extending.overload(np.isin)
-def np_isin(a, b):
-    def np_isin_impl(a, b):
-        shape = a.shape
-        a = a.ravel()
-        n = len(a)
-        result = np.full(n, False)
-        set_b = set(b)
-        for i in np.arange(n):
-            if a[i] in set_b:
-                result[i] = True
-        return result.reshape(shape)
-    return np_isin_impl
+# the board rules are module level kernels compiled with cache=True so a new process loads them from
+# __pycache__ instead of compiling them, the jitclass below only holds a board and calls into them.
+# engine is the tuple (action_direction, neighbors, bomb_life, fire_life) of a BMBoard, see BMBoard.engine
+
+@numba.njit(cache=True, nogil=True)
+def neighbor_table(board_width, action_direction):
+    '''
+    flat index of the neighbour of every cell in each move direction, -1 off the board
+    '''
+    neighbors = np.full((board_width*board_width, action_direction.shape[0]), -1, dtype=np.int_)
+    for y in range(board_width):
+        for x in range(board_width):
+            for a in range(action_direction.shape[0]):
+                ny = y + action_direction[a, 0]
+                nx = x + action_direction[a, 1]
+                if ny >= 0 and ny < board_width and nx >= 0 and nx < board_width:
+                    neighbors[y*board_width + x, a] = ny*board_width + nx
+    return neighbors
+
+
+@numba.njit(cache=True, nogil=True)
+def restart_kernel(board_width, n_blocks, p1pos, p2pos, start_health, start_ammo, start_power):
+    '''
+    layers and player_meta of a new random board
+    '''
+    board = np.zeros((board_width, board_width), dtype=np.int_)
+    board[p1pos[0], p1pos[1]] = Entities.P1.value
+    board[p2pos[0], p2pos[1]] = Entities.P2.value
+
+    # possible block positions
+    possible_block_pos = np.empty((board_width*board_width, 2), dtype=np.int_)
+    n_possible = 0
+    for y in range(board_width):
+        for x in range(board_width):
+            if board[y, x] != Entities.P1.value and board[y, x] != Entities.P2.value:
+                possible_block_pos[n_possible, 0] = y
+                possible_block_pos[n_possible, 1] = x
+                n_possible += 1
+
+    # choose and place N possible block positions
+    block_pos_idxs = np.random.choice(np.arange(0, n_possible), n_blocks)
+    for bpi in block_pos_idxs:
+        board[possible_block_pos[bpi, 0], possible_block_pos[bpi, 1]] = Entities.BLOCK.value
+
+    # clear positions adjacent to players
+    for y, x in ((0, 1), (1, 0), (1, 1)):
+        board[y, x] = 0
+        board[board_width-1-y, board_width-1-x] = 0
+
+    # player_id, health, ammo, power
+    player_meta = np.array([
+        [Entities.P1.value, start_health, start_ammo, start_power],
+        [Entities.P2.value, start_health, start_ammo, start_power]
+    ], dtype=np.int_)
+
+    return board, np.zeros_like(board), np.zeros_like(board), np.zeros_like(board), np.zeros_like(board), player_meta
+
+
+@numba.njit(cache=True, nogil=True)
+def meta_row(player_meta, player_id):
+    '''
+    row of player_id in player_meta
+    '''
+    for i in range(player_meta.shape[0]):
+        if player_meta[i, 0] == player_id:
+            return i
+    return -1
+
+
+@numba.njit(cache=True, nogil=True)
+def legal_action_mask_kernel(engine, player_id, entity_board, bombs_board, player_meta):
+    '''
+    legal actions of player_id as an int mask, bit a is set when action value a is legal
+    '''
+    action_direction, neighbors, bomb_life, fire_life = engine
+    entity_flat = entity_board.ravel()
+    bombs_flat = bombs_board.ravel()
+    cell = 0
+    while entity_flat[cell] != player_id:
+        cell += 1
+
+    mask = 1 << Actions.NONE.value
+    # moves onto free in-bounds cells
+    for a in range(neighbors.shape[1]):
+        n = neighbors[cell, a]
+        if n >= 0 and entity_flat[n] == 0 and bombs_flat[n] == 0:
+            mask |= 1 << a
+    # bomb if not standing on one and the player has ammo
+    if bombs_flat[cell] == 0 and player_meta[meta_row(player_meta, player_id), 2] > 0:
+        mask |= 1 << Actions.BOMB.value
+    return mask
+
+
+@numba.njit(cache=True, nogil=True)
+def add_bomb_kernel(engine, bombs_board, y, x, entity_board, player_meta):
+    '''
+    add a bomb at (y, x) in place, the player standing there spends one ammo
+    '''
+    # ensure not placed ontop of another bomb
+    if bombs_board[y, x] != 0:
+        return
+    bombs_board[y, x] = engine[2]
+
+    # decrease ammo
+    p = entity_board[y, x]
+    if p == Entities.P1.value or p == Entities.P2.value:
+        player_meta[meta_row(player_meta, p), 2] -= 1
+
+
+@numba.njit(cache=True, nogil=True)
+def add_fire_kernel(engine, fire_board, y, x, entity_board):
+    '''
+    add the fire of a bomb exploding at (y, x) in place
+    '''
+    action_direction, neighbors, bomb_life, fire_life = engine
+    power = 2
+    board_width = fire_board.shape[0]
+    fire_board[y, x] = fire_life
+    # add fire entity in 4 directions from the center
+    for d in range(action_direction.shape[0]):
+        # propagate the fire radius based on power
+        for p in range(1, power):
+            dy = y + action_direction[d, 0]*p
+            dx = x + action_direction[d, 1]*p
+            # stop propagating at the board edge or if hit block
+            if dy < 0 or dx < 0 or dy >= board_width or dx >= board_width:
+                break
+            if entity_board[dy, dx] == Entities.BLOCK.value:
+                break
+            fire_board[dy, dx] = fire_life
+
+
+@numba.njit(cache=True, nogil=True)
+def step_kernel(engine, actions, board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done):
+    '''
+    apply actions, rows of (player_id, action_id), to a copy of the board state and return it
+    '''
+    action_direction, neighbors, bomb_life, fire_life = engine
+    board = board.copy()
+    bombs_board = bombs_board.copy()
+    fire_board = fire_board.copy()
+    ammo_board = ammo_board.copy()
+    powerup_board = powerup_board.copy()
+    player_meta = player_meta.copy()
+    board_width = board.shape[0]
+
+    # apply actions to layers
+    for i in range(actions.shape[0]):
+        # player id, action value
+        p = actions[i, 0]
+        a = actions[i, 1]
+
+        # handle none
+        if a == Actions.NONE.value:
+            continue
+
+        p_ammo = player_meta[meta_row(player_meta, p), 2]
+        py, px = -1, -1
+        for y in range(board_width):
+            for x in range(board_width):
+                if board[y, x] == p:
+                    py, px = y, x
+
+        # handle bombs
+        if a == Actions.BOMB.value:
+            if p_ammo <= 0:
+                continue
+            add_bomb_kernel(engine, bombs_board, py, px, board, player_meta)
+            continue
+
+        # bounded proposed new pos
+        ny = min(max(py + action_direction[a, 0], 0), board_width-1)
+        nx = min(max(px + action_direction[a, 1], 0), board_width-1)
+
+        # apply movement to player board
+        if board[ny, nx] == 0 and bombs_board[ny, nx] == 0:
+            board[py, px] = 0
+            board[ny, nx] = p
+
+    # tick bombs
+    for y in range(board_width):
+        for x in range(board_width):
+            if bombs_board[y, x] > 0:
+                bombs_board[y, x] -= 1
+                # explode bombs
+                if bombs_board[y, x] == 0:
+                    add_fire_kernel(engine, fire_board, y, x, board)
+
+    # chain bombs, every bomb standing in fire detonates and so do the bombs its blast reaches
+    power = 2
+    detonating = []
+    for y in range(board_width):
+        for x in range(board_width):
+            if bombs_board[y, x] > 0 and fire_board[y, x] > 0:
+                detonating.append((y, x))
+    while len(detonating) > 0:
+        by, bx = detonating.pop()
+        if bombs_board[by, bx] == 0:
+            continue
+        bombs_board[by, bx] = 0
+        add_fire_kernel(engine, fire_board, by, bx, board)
+        for d in range(action_direction.shape[0]):
+            # bombs the blast reached are now standing in fire
+            for p in range(1, power):
+                fy = by + action_direction[d, 0]*p
+                fx = bx + action_direction[d, 1]*p
+                if fy < 0 or fx < 0 or fy >= board_width or fx >= board_width:
+                    break
+                if bombs_board[fy, fx] > 0 and fire_board[fy, fx] > 0:
+                    detonating.append((fy, fx))
+
+    # tick fire
+    for y in range(board_width):
+        for x in range(board_width):
+            if fire_board[y, x] > 0:
+                # apply damage to players
+                p = board[y, x]
+                if p == Entities.P1.value or p == Entities.P2.value:
+                    player_meta[meta_row(player_meta, p), 1] -= 1
+                fire_board[y, x] -= 1
+
+    # check if any players have lost
+    for i in range(player_meta.shape[0]):
+        if player_meta[i, 1] <= 0:
+            done = True
+
+    return board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done
+
 
 spec = [
     ('board_width', numba.int_),
@@ -57,6 +262,7 @@ spec = [
     ('action_direction', numba.int_[:, :]),
     ('p1pos', numba.int_[:]),
     ('p2pos', numba.int_[:]),
+    ('_neighbors', numba.int_[:, :]),
 
     ('board', numba.int_[:,:]),
     ('bombs_board', numba.int_[:,:]),
@@ -96,17 +302,13 @@ class BMBoard:
         ], dtype=np.int_)
         self.p1pos = np.array([0,0], dtype=np.int_)
         self.p2pos = np.array([self.board_shape[0]-1, self.board_shape[0]-1], dtype=np.int_)
-        
-        self.board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
-        self.bombs_board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
-        self.fire_board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
-        self.ammo_board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
-        self.powerup_board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
+        # flat index of the neighbour of every cell in each move direction, -1 off the board
+        self._neighbors = neighbor_table(board_width, self.action_direction)
 
         self._n_blocks = (board_width**2)//2
 
-        self._bomb_life = 4
-        self._fire_life = 2
+        self._bomb_life = BOMB_LIFE
+        self._fire_life = FIRE_LIFE
 
         self._start_health = start_health
         self._start_ammo = start_ammo
@@ -117,31 +319,9 @@ class BMBoard:
         #self._obstacles = np.array([3, 4, 1, 2], dtype=np.int_)
         #self._obtainable = np.array([7, 6], dtype=np.int_)
 
-        # player_id, health, ammo, power
-        self.player_meta = np.array([
-            [1, self._start_health, self._start_ammo, self._start_power],
-            [2, self._start_health, self._start_ammo, self._start_power]
-        ], dtype=np.int_)
-
         self.done = False
         self.restart_board()
 
-    def __repr__(self):
-        return str(self.board + self.bombs_board + self.fire_board)
-
-
-    # def isin_nb(self, a, b):
-    #     shape = a.shape
-    #     a = a.ravel()
-    #     n = len(a)
-    #     result = np.full(n, False)
-    #     set_b = set(b)
-    #     for i in range(n):
-    #         if a[i] in set_b:
-    #             result[i] = True
-    #     return result.reshape(shape)
-
-
     def render(self, boards=None):
         if boards == None:
             return self.board + self.fire_board + self.bombs_board
@@ -156,37 +336,8 @@ class BMBoard:
         p1pos, p2pos: tuple positions of players on board
         board_shape: tuple board dimensions
         '''
-        self.board = np.zeros((self.board_width, self.board_width), dtype=np.int_)
-        self.board[self.p1pos[0], self.p1pos[1]] = Entities.P1.value
-        self.board[self.p2pos[0], self.p2pos[1]] = Entities.P2.value
-
-        # possible block positions
-        possible_block_pos = np.argwhere(np.isin(self.board, np.array([Entities.P1.value, Entities.P2.value], dtype=np.int_)) == np.array(False, dtype=np.bool_))
-
-        # choose and place N possible block positions
-        block_pos_idxs = np.random.choice(np.arange(0, len(possible_block_pos)), self._n_blocks)
-        for bpi in block_pos_idxs:
-            bp = possible_block_pos[bpi]
-            bpy, bpx = bp
-            self.board[bpy, bpx] = Entities.BLOCK.value
-
-        # clear positions adjacent to players
-        for y,x in np.array([[0,1], [1,0], [1,1]], dtype=np.int_):
-            self.board[y, x] = 0
-            self.board[self.board_width-1-y, self.board_width-1-x] = 0
-
-        
-        self.bombs_board = np.zeros_like(self.board)
-        self.fire_board = np.zeros_like(self.board)
-        self.ammo_board = np.zeros_like(self.board)
-        self.powerup_board = np.zeros_like(self.board)
-
-        # player_id, health, ammo, power
-        self.player_meta = np.array([
-            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power],
-            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power]
-        ], dtype=np.int_)
-
+        self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta = restart_kernel(
+            self.board_width, self._n_blocks, self.p1pos, self.p2pos, self._start_health, self._start_ammo, self._start_power)
         self.done = False
 
         return self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done
@@ -194,39 +345,34 @@ class BMBoard:
     @property
     def board_state(self):
         return self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done
-    
+
+    @property
+    def engine(self):
+        '''
+        board parameters the module level kernels take
+        '''
+        return self.action_direction, self._neighbors, self._bomb_life, self._fire_life
+
+    def legal_action_mask(self, player_id, board_states):
+        '''
+        legal actions of player_id in the given board state as an int mask, bit a is set when action value a is legal
+        '''
+        return legal_action_mask_kernel(self.engine, player_id, board_states[0], board_states[1], board_states[5])
+
     def valid_actions(self, player_id, board_states):
         '''
-        returns a list of valid actions from the given board state
+        returns an array of valid actions from the given board state
         '''
-        current_board_states = board_states
-        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = current_board_states
-        player_pos = np.argwhere(entity_board == player_id)[0]
-        player_meta_idx = np.argwhere(player_meta[:, 0] == player_id).item()
-        # check actions
-        actions = np.empty(0, dtype=np.int_)
-        for a in np.array([0,1,2,3,4,6], dtype=np.int_): # cant iteratve via Actions directly with numba
-            # direction actions
-            if np.isin(np.array([a], dtype=np.int_), np.array([Actions.UP.value, Actions.DOWN.value, Actions.LEFT.value, Actions.RIGHT.value])):
-                new_pos = player_pos + self.action_direction[a]
-                py, px = new_pos
-                # make sure new_pos is in bounds
-                valid_bounds = np.all(new_pos >= 0) and np.all(new_pos < entity_board.shape[0])
-                if valid_bounds:
-                    valid_move = entity_board[py, px] == 0 and bombs_board[py, px] == 0
-                    if valid_move:
-                        actions = np.append(actions, a)
-            # bomb and detonation and check if player has enough ammo to place bomb
-            if a in np.array([Actions.BOMB.value]):
-                py, px = player_pos
-                valid_move = bombs_board[py, px] == 0 and player_meta[player_meta_idx, 2] > 0
-                if valid_move:
-                    actions = np.append(actions, a)
-        
-        actions = np.append(actions, Actions.NONE.value)
-
-        return actions
+        mask = self.legal_action_mask(player_id, board_states)
+        actions = np.empty(7, dtype=np.int_)
+        n = 0
+        for a in range(7):
+            if (mask >> a) & 1:
+                actions[n] = a
+                n += 1
+        return actions[:n]
 
+    
     def add_bomb_to_board(self, board, pos, meta):
         board[pos[0], pos[1]] = Entities.BOMB.value
         meta = np.append(meta, [pos, self._bomb_life])
@@ -252,48 +398,19 @@ class BMBoard:
         '''
         board = board.copy()
         player_meta = player_meta.copy()
-        y, x = pos
-
-        # ensure not placed ontop of another bomb
-        if board[y,x] != 0:
-            return board, player_meta
-
-        board[y, x] = self._bomb_life
-
-        # decrease ammo
-        if np.isin(np.array(entity_board[y, x], dtype=np.int_), self._players):
-            # which idx in player meta?
-            p = entity_board[y, x]
-            pm_idx = np.argwhere(player_meta[:,0] == p).ravel()[0]
-            # apply ammo change
-            player_meta[pm_idx, 2] -= 1
-
+        add_bomb_kernel(self.engine, board, pos[0], pos[1], entity_board, player_meta)
         return board, player_meta        
 
 
-
     def add_fire(self, board, pos, entity_board, player_meta):
         '''
         add fire to fire board at position
         requires entity_board to check for blocks and players
         requires player_meta to register damage
         '''
-        power = 2
         board = board.copy()
         player_meta = player_meta.copy()
-        y, x = pos
-        board[y, x] = self._fire_life
-        # add fire entity in 4 directions from the center
-        for dir in self.action_direction:
-            # propagate the fire radius based on power
-            for p in np.arange(1, power):
-                dy, dx = np.clip(pos + dir*p, a_min=0, a_max=self.board_width-1)
-                # stop propagating if hit block
-                if entity_board[dy, dx] == Entities.BLOCK.value:
-                    break
-                else:
-                    board[dy, dx] = self._fire_life
-
+        add_fire_kernel(self.engine, board, pos[0], pos[1], entity_board)
         return board, player_meta
 
     
@@ -312,91 +429,13 @@ class BMBoard:
         actions are defined as a list of tuples, [(player_id, action_id), ...]
         '''
         if simulate == np.array(False, dtype=np.bool_):
-            board = self.board.copy()
-            bombs_board = self.bombs_board.copy()
-            fire_board = self.fire_board.copy()
-            ammo_board = self.ammo_board.copy()
-            powerup_board = self.powerup_board.copy()
-            player_meta = self.player_meta.copy()
+            board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = step_kernel(
+                self.engine, actions, self.board, self.bombs_board, self.fire_board, self.ammo_board,
+                self.powerup_board, self.player_meta, self.done)
         else:
-            board = prev_board.copy()
-            bombs_board = prev_bombs.copy()
-            fire_board = prev_fire.copy()
-            ammo_board = prev_ammo.copy()
-            powerup_board = prev_powerup.copy()
-            player_meta = prev_player_meta.copy()
-
-        done = self.done
-
-        # apply actions to layers
-        for i, pa in enumerate(actions):
-            # player id, action value
-            p, a = pa
-
-            p_ammo = player_meta[player_meta[:, 0] == p, 2][0]
-            p_currpos = np.argwhere(board == p)[0]
-
-            # handle none
-            if a == Actions.NONE.value:
-                continue
-
-            # handle bombs
-            if a == Actions.BOMB.value:
-                if p_ammo <= 0:
-                    continue
-                bombs_board, player_meta = self.add_bomb(bombs_board, p_currpos, board, player_meta)
-                continue
-            
-            # bounded proposed new pos
-            p_newpos = np.clip(p_currpos + self.action_direction[a], a_min=0, a_max=self.board_width-1)
-            
-            # apply movement to player board
-            if board[p_newpos[0], p_newpos[1]] == 0 and bombs_board[p_newpos[0], p_newpos[1]] == 0:
-                board[p_currpos[0], p_currpos[1]] = 0
-                board[p_newpos[0], p_newpos[1]] = p
-
-        # tick bombs
-        active_bombs = np.argwhere(bombs_board > 0)
-        for ab in active_bombs:
-            bombs_board[ab[0], ab[1]] -= 1
-            # explode bombs
-            if bombs_board[ab[0], ab[1]] == 0:
-                # add fire
-                fire_board, player_meta = self.add_fire(fire_board, ab, board, player_meta)
-
-        
-        # chain bombs
-        active_fire = np.argwhere(fire_board > 0)
-        bi = 0
-        while bi < len(active_fire):
-            af = active_fire[bi]
-            afy, afx = af
-            if bombs_board[afy, afx] > 0:
-                bombs_board[afy, afx] = 0
-                fire_board, player_meta = self.add_fire(fire_board, af, board, player_meta)
-            active_fire = np.argwhere(fire_board > 0)
-            bi += 1
-        
-        
-        # tick fire
-        active_fire = np.argwhere(fire_board > 0)
-        for af in active_fire:
-            afy, afx = af
-
-            # apply damage to players
-            if np.isin(np.array(board[afy, afx], dtype=np.int_), self._players):
-                # which idx in player meta?
-                p = board[afy, afx]
-                pm_idx = np.argwhere(player_meta[:,0] == p).ravel()[0]
-                # apply damage
-                player_meta[pm_idx, 1] -= 1
-
-            fire_board[afy, afx] -= 1
-
-        # check if any players have lost
-        dead_players = player_meta[player_meta[:, 1] <= 0, 0]
-        if len(dead_players) > 0:
-            done = True
+            board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = step_kernel(
+                self.engine, actions, prev_board, prev_bombs, prev_fire, prev_ammo, prev_powerup,
+                prev_player_meta, self.done)
 
         # modify internal board states if not simulating, otherwise return the modified board states
         if simulate == False:
@@ -409,3 +448,43 @@ class BMBoard:
             self.done = done
         else:
             return board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done
+
+
+def make_engine(board_width=9):
+    '''
+    engine tuple of a BMBoard of board_width, built without the jitclass
+    '''
+    action_direction = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]], dtype=np.int_)
+    return action_direction, neighbor_table(board_width, action_direction), BOMB_LIFE, FIRE_LIFE
+
+
+def restart_state(board_width=9, start_health=3, start_ammo=3):
+    '''
+    board state of a new random board, built without the jitclass
+    '''
+    p1pos = np.array([0, 0], dtype=np.int_)
+    p2pos = np.array([board_width-1, board_width-1], dtype=np.int_)
+    return restart_kernel(board_width, (board_width**2)//2, p1pos, p2pos, start_health, start_ammo, 2) + (False,)
+
+
+def warmup(board_width=5, jitclass=True):
+    '''
+    compile the kernels, or load them from the on-disk cache, by running each once on a small board.
+    jitclass methods can not be cached and take most of the time, processes that only use the kernels
+    (make_engine, restart_state, step_kernel, ...) can skip them with jitclass=False.
+    returns the seconds it took, call it once when a worker process starts
+    '''
+    t0 = time.perf_counter()
+    engine = make_engine(board_width)
+    state = restart_state(board_width, 1, 1)
+    legal_action_mask_kernel(engine, 1, state[0], state[1], state[5])
+    step_kernel(engine, np.array([[1, Actions.BOMB.value], [2, Actions.NONE.value]], dtype=np.int_), *state)
+
+    if jitclass:
+        game = BMBoard(board_width, 1, 1)
+        state = game.board_state
+        game.valid_actions(1, state)
+        game.step(np.array([[1, Actions.BOMB.value], [2, Actions.NONE.value]], dtype=np.int_), True, *state[:-1])
+        game.step(np.array([[1, Actions.NONE.value], [2, Actions.NONE.value]], dtype=np.int_))
+        game.engine
+    return time.perf_counter() - t0
@@ -0,0 +1,197 @@
+import numpy as np
+from bm import PackedBMBoard, Actions
+
+
+_BOMB = Actions.BOMB.value
+_NONE = Actions.NONE.value
+
+
+class SparseBMBoard(PackedBMBoard):
+    '''
+    BMBoard that keeps bombs and fire as dicts of their live cells, so a step costs time in the number of
+    bombs, fires and players instead of the board area. meant for large boards where few cells are active
+
+    board: dense entity board, only copied by steps that move a player
+    bombs_board, fire_board: {(y, x): ticks} of the live bombs and fires
+    ammo_board, powerup_board: dense and passed through untouched, the engine never changes them
+    '''
+    def _cells(self, layer):
+        ys, xs = np.nonzero(layer)
+        return dict(zip(zip(ys.tolist(), xs.tolist()), layer[ys, xs].tolist()))
+
+    def _layer(self, cells):
+        layer = np.zeros(self.board_shape, dtype=np.int32)
+        for (y, x), value in cells.items():
+            layer[y, x] = value
+        return layer
+
+
+    def pack_board_state(self, board_states):
+        '''
+        convert a BMBoard board state into its sparse form
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        return (entity_board.copy(), self._cells(bombs_board), self._cells(fire_board), ammo_board.copy(),
+                powerup_board.copy(), player_meta.copy(), done)
+
+    def unpack_board_state(self, board_states):
+        '''
+        convert a sparse board state back into BMBoard arrays
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        return (entity_board.copy(), self._layer(bombs_board), self._layer(fire_board), ammo_board.copy(),
+                powerup_board.copy(), player_meta.copy(), done)
+
+
+    def _bomb_timers(self, board_states):
+        return dict(board_states[1])
+
+    def _timers_at(self, board_states, y, x):
+        return board_states[1].get((y, x), 0), board_states[2].get((y, x), 0)
+
+    def _cell_at(self, board_states, y, x):
+        return board_states[0][y, x] != 0 or (y, x) in board_states[1], board_states[2].get((y, x), 0)
+
+
+    def legal_action_mask(self, player_id, board_states):
+        '''
+        legal actions of player_id in the given board state as an int mask, bit a is set when action value a is legal
+        '''
+        entity_board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = board_states
+        pm_idx = self._meta_rows[player_id]
+        py, px = int(player_meta[pm_idx, 4]), int(player_meta[pm_idx, 5])
+        entity_flat = entity_board.ravel()
+
+        mask = 1 << _NONE
+        # moves onto free in-bounds cells
+        for a, n in enumerate(self._neighbor_cells[py*self.board_width + px]):
+            if n >= 0 and entity_flat[n] == 0 and divmod(n, self.board_width) not in bombs_board:
+                mask |= 1 << a
+        # bomb if not standing on one and the player has ammo
+        if (py, px) not in bombs_board and player_meta[pm_idx, 2] > 0:
+            mask |= 1 << _BOMB
+        return mask
+
+
+    def step_changes(self, actions, board_states):
+        new_states = self.step(actions, True, *board_states[:-1])
+        changes = []
+        prev_board, board = board_states[0], new_states[0]
+        # the entity board only changes where players moved from or to
+        if board is not prev_board:
+            cells = {(int(y), int(x)) for meta in (board_states[5], new_states[5]) for y, x in meta[:, 4:6]}
+            for y, x in cells:
+                if prev_board[y, x] != board[y, x]:
+                    changes.append((0, y, x, int(prev_board[y, x]), int(board[y, x])))
+        for layer in (1, 2):
+            prev_cells, cells = board_states[layer], new_states[layer]
+            for y, x in prev_cells.keys() | cells.keys():
+                old, new = prev_cells.get((y, x), 0), cells.get((y, x), 0)
+                if old != new:
+                    changes.append((layer, y, x, old, new))
+        return new_states, changes
+
+
+    def step(self, actions, simulate=False, prev_board=None, prev_bombs=None, prev_fire=None, prev_ammo=None, prev_powerup=None, prev_player_meta=None):
+        '''
+        apply supplied actions to a board state.
+        actions are defined as a list of tuples, [(player_id, action_id), ...]
+        '''
+        if simulate == False:
+            board = self.board
+            bombs = self.bombs_board
+            fire = dict(self.fire_board)
+            ammo_board = self.ammo_board
+            powerup_board = self.powerup_board
+            player_meta = self.player_meta.copy()
+        else:
+            board = prev_board
+            bombs = prev_bombs
+            fire = dict(prev_fire)
+            ammo_board = prev_ammo
+            powerup_board = prev_powerup
+            player_meta = prev_player_meta.copy()
+
+        done = self.done
+        board_copied = False
+        new_bombs = {}
+
+        # apply actions to layers
+        for p, a in actions:
+            pm_idx = self._meta_rows[p]
+            py, px = int(player_meta[pm_idx, 4]), int(player_meta[pm_idx, 5])
+
+            # handle none
+            if a == _NONE:
+                continue
+
+            # handle bombs, ensure not placed ontop of another bomb
+            if a == _BOMB:
+                if player_meta[pm_idx, 2] <= 0 or (py, px) in bombs or (py, px) in new_bombs:
+                    continue
+                new_bombs[py, px] = self._bomb_life
+                player_meta[pm_idx, 2] -= 1
+                continue
+
+            # bounded proposed new pos
+            dy, dx = self.action_direction[a]
+            ny = min(max(py + dy, 0), self.board_width-1)
+            nx = min(max(px + dx, 0), self.board_width-1)
+
+            # apply movement to player board and player_meta, the board is copied on the first move
+            if board[ny, nx] == 0 and (ny, nx) not in bombs and (ny, nx) not in new_bombs:
+                if not board_copied:
+                    board = board.copy()
+                    board_copied = True
+                board[py, px] = 0
+                board[ny, nx] = p
+                player_meta[pm_idx, 4] = ny
+                player_meta[pm_idx, 5] = nx
+
+        # tick bombs, the ones that run out explode
+        power = 2
+        ticked = {}
+        detonating = []
+        for cells in (bombs, new_bombs):
+            for b, t in cells.items():
+                if t > 1:
+                    ticked[b] = t - 1
+                else:
+                    detonating.append(b)
+        bombs = ticked
+
+        # chain bombs, every bomb standing in fire detonates and so do the bombs its blast reaches
+        detonating.extend(b for b in bombs if b in fire)
+        while len(detonating) > 0:
+            by, bx = detonating.pop()
+            bombs.pop((by, bx), None)
+            for cell in self._blast_cells(by, bx, board, power):
+                fire[cell] = self._fire_life
+                if cell in bombs:
+                    detonating.append(cell)
+
+        # apply damage to players standing in fire
+        for pm_idx in self._meta_rows.values():
+            if (int(player_meta[pm_idx, 4]), int(player_meta[pm_idx, 5])) in fire:
+                player_meta[pm_idx, 1] -= 1
+
+        # tick fire
+        fire = {cell: t - 1 for cell, t in fire.items() if t > 1}
+
+        # check if any players have lost
+        if np.any(player_meta[:, 1] <= 0):
+            done = True
+
+        # modify internal board states if not simulating, otherwise return the modified board states
+        if simulate == False:
+            self.board = board
+            self.bombs_board = bombs
+            self.fire_board = fire
+            self.ammo_board = ammo_board
+            self.powerup_board = powerup_board
+            self.player_meta = player_meta
+            self.done = done
+            self.fuses = self.next_bomb_fuses(self.fuses, self.board_state)
+            self._danger_board = None
+        else:
+            return board, bombs, fire, ammo_board, powerup_board, player_meta, done
@@ -0,0 +1,207 @@
+import numpy as np
+from bm import Actions, Entities
+
+
+class VecBMBoard:
+    '''
+    N independent BMBoard games stepped together with array ops
+
+    layers are stacked (n_games, board_width, board_width) arrays, player_meta is (n_games, 2, 4)
+    and row j of every game belongs to player j+1
+    '''
+    def __init__(self, n_games, board_width=9, start_health=3, start_ammo=3):
+        self.n_games = n_games
+        self.board_width = board_width
+        self.board_shape = (n_games, board_width, board_width)
+        self.action_direction = np.array([
+            (-1, 0),
+            (1, 0),
+            (0, -1),
+            (0, 1)
+        ], dtype=np.int32)
+        self.p1pos = (0,0)
+        self.p2pos = (board_width-1, board_width-1)
+
+        self.board = None
+        self.bombs_board = None
+        self.fire_board = None
+        self.ammo_board = None
+        self.powerup_board = None
+
+        self._n_blocks = (board_width**2)//2
+
+        self._bomb_life = 4
+        self._fire_life = 2
+
+        self._start_health = start_health
+        self._start_ammo = start_ammo
+        self._start_power = 2
+
+        self._players = [Entities.P1.value, Entities.P2.value]
+        self._games = np.arange(n_games)
+
+        self.player_meta = None
+        self.done = None
+        self.restart_board()
+
+
+    def restart_board(self, games=None):
+        '''
+        restart boards, either all of them or the games selected by index / boolean mask
+        '''
+        if self.board is None:
+            self.board = np.zeros(self.board_shape, dtype=np.int32)
+            self.bombs_board = np.zeros_like(self.board)
+            self.fire_board = np.zeros_like(self.board)
+            self.ammo_board = np.zeros_like(self.board)
+            self.powerup_board = np.zeros_like(self.board)
+            self.player_meta = np.zeros((self.n_games, 2, 4), dtype=np.int32)
+            self.done = np.zeros(self.n_games, dtype=bool)
+
+        games = self._games if games is None else self._games[games]
+        w = self.board_width
+
+        board = np.zeros((len(games), w, w), dtype=np.int32)
+        board[:, self.p1pos[0], self.p1pos[1]] = Entities.P1.value
+        board[:, self.p2pos[0], self.p2pos[1]] = Entities.P2.value
+
+        # possible block positions
+        possible_block_pos = np.argwhere(np.isin(board[0], self._players) == False)
+
+        # choose and place N possible block positions per game
+        block_pos_idxs = np.random.randint(0, len(possible_block_pos), (len(games), self._n_blocks))
+        bpy, bpx = possible_block_pos[block_pos_idxs].transpose(2, 0, 1)
+        board[np.arange(len(games))[:, None], bpy, bpx] = Entities.BLOCK.value
+
+        # clear positions adjacent to players
+        for y,x in np.array([[0,1], [1,0], [1,1]], dtype=np.int32):
+            board[:, y, x] = 0
+            board[:, w-1-y, w-1-x] = 0
+
+        self.board[games] = board
+        self.bombs_board[games] = 0
+        self.fire_board[games] = 0
+        self.ammo_board[games] = 0
+        self.powerup_board[games] = 0
+
+        # player_id, health, ammo, power
+        self.player_meta[games] = [
+            [Entities.P1.value, self._start_health, self._start_ammo, self._start_power],
+            [Entities.P2.value, self._start_health, self._start_ammo, self._start_power]
+        ]
+
+        self.done[games] = False
+
+        return self.board_state
+
+    @property
+    def board_state(self):
+        return self.board, self.bombs_board, self.fire_board, self.ammo_board, self.powerup_board, self.player_meta, self.done
+
+    def game_state(self, i):
+        '''
+        board state of game i in the BMBoard tuple layout, player_meta gains the y, x columns BMBoard tracks
+        '''
+        positions = [np.argwhere(self.board[i] == p)[0] for p in self._players]
+        player_meta = np.concatenate([self.player_meta[i], positions], axis=1).astype(np.int32)
+        return (self.board[i].copy(), self.bombs_board[i].copy(), self.fire_board[i].copy(), self.ammo_board[i].copy(),
+                self.powerup_board[i].copy(), player_meta, bool(self.done[i]))
+
+
+    def player_positions(self, player_id):
+        '''
+        (y, x) arrays with the position of player_id in every game
+        '''
+        flat = np.argmax(self.board.reshape(self.n_games, -1) == player_id, axis=1)
+        return np.divmod(flat, self.board_width)
+
+
+    def _shift(self, mask, direction):
+        '''
+        move every set cell one step in direction, cells leaving the board are dropped
+        '''
+        out = np.zeros_like(mask)
+        if direction == Actions.UP.value:
+            out[:, :-1, :] = mask[:, 1:, :]
+        elif direction == Actions.DOWN.value:
+            out[:, 1:, :] = mask[:, :-1, :]
+        elif direction == Actions.LEFT.value:
+            out[:, :, :-1] = mask[:, :, 1:]
+        else:
+            out[:, :, 1:] = mask[:, :, :-1]
+        return out
+
+    def blast(self, centres):
+        '''
+        cells covered by the explosions of the bombs in the (n_games, w, w) mask centres
+        '''
+        power = 2
+        open_cells = self.board != Entities.BLOCK.value
+        fire = centres.copy()
+        for direction in range(len(self.action_direction)):
+            ray = centres
+            # propagate the fire radius based on power, stop propagating if hit block
+            for _ in range(1, power):
+                ray = self._shift(ray, direction) & open_cells
+                fire |= ray
+        return fire
+
+
+    def step(self, actions):
+        '''
+        apply actions to every game.
+        actions is an (n_games, 2) array, column j holds the action of player j+1
+        '''
+        actions = np.asarray(actions)
+        games = self._games
+        board = self.board
+        bombs_board = self.bombs_board
+        fire_board = self.fire_board
+        player_meta = self.player_meta
+
+        # apply actions to layers, players act in order like BMBoard.step
+        for j, p in enumerate(self._players):
+            a = actions[:, j]
+            py, px = self.player_positions(p)
+
+            # handle bombs, ensure not placed ontop of another bomb
+            place = (a == Actions.BOMB.value) & (player_meta[:, j, 2] > 0) & (bombs_board[games, py, px] == 0)
+            bombs_board[games[place], py[place], px[place]] = self._bomb_life
+            player_meta[place, j, 2] -= 1
+
+            # bounded proposed new pos
+            move = (a >= 0) & (a < len(self.action_direction))
+            direction = self.action_direction[np.where(move, a, 0)]
+            ny = np.clip(py + direction[:, 0], 0, self.board_width-1)
+            nx = np.clip(px + direction[:, 1], 0, self.board_width-1)
+
+            # apply movement to player board
+            move &= (board[games, ny, nx] == 0) & (bombs_board[games, ny, nx] == 0)
+            board[games[move], py[move], px[move]] = 0
+            board[games[move], ny[move], nx[move]] = p
+
+        # tick bombs
+        active_bombs = bombs_board > 0
+        bombs_board -= active_bombs
+        exploding = active_bombs & (bombs_board == 0)
+        fire_board[self.blast(exploding)] = self._fire_life
+
+        # chain bombs
+        chained = (bombs_board > 0) & (fire_board > 0)
+        while chained.any():
+            bombs_board[chained] = 0
+            new_fire = self.blast(chained)
+            fire_board[new_fire] = self._fire_life
+            chained = (bombs_board > 0) & new_fire
+
+        # tick fire, apply damage to players standing in it
+        active_fire = fire_board > 0
+        for j, p in enumerate(self._players):
+            py, px = self.player_positions(p)
+            player_meta[:, j, 1] -= active_fire[games, py, px]
+        fire_board -= active_fire
+
+        # check if any players have lost
+        self.done |= np.any(player_meta[:, :, 1] <= 0, axis=1)
+
+        return self.board_state
@@ -1,27 +1,159 @@
 # %%
-from bm import BMBoard, Actions
+from bm import BMBoard, PackedBMBoard, Actions, mask_to_actions
 import numpy as np
-from copy import deepcopy
 import time
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
 import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from zobrist import Zobrist
+
+# %%
+class RandomBuffer:
+    '''
+    uniform floats drawn in bulk from a np.random.Generator and handed out one at a time, refilled
+    when used up. cheaper per draw than np.random.choice and independent of the global rng.
+    rng is a Generator or anything np.random.default_rng accepts as a seed
+    '''
+    def __init__(self, rng=None, size=4096):
+        self.rng = np.random.default_rng(rng)
+        self.size = size
+        self._fill()
+
+    def _fill(self):
+        self._values = self.rng.random(self.size).tolist()
+        self._i = 0
+
+    def index(self, n):
+        '''
+        random integer in [0, n)
+        '''
+        if self._i == self.size:
+            self._fill()
+        u = self._values[self._i]
+        self._i += 1
+        return int(u*n)
+
+    def choice(self, values):
+        return values[self.index(len(values))]
+
+
+def random_buffer(rng=None):
+    '''
+    RandomBuffer for a search. rng can be a RandomBuffer, a Generator or a seed, with None the seed
+    comes from the global rng so np.random.seed still makes a search repeatable
+    '''
+    if isinstance(rng, RandomBuffer):
+        return rng
+    if rng is None:
+        rng = np.random.randint(2**31)
+    return RandomBuffer(rng)
+
+# %%
+def step_actions(player, action, other_action):
+    '''
+    step actions of player taking action while the other player takes other_action
+    '''
+    if player == 1:
+        return [(1, action), (2, other_action)]
+    else:
+        return [(1, other_action), (2, action)]
+
+
+def apply_action(game, state, player, action, pending=None):
+    '''
+    state after the tree ply of player taking action. both players act at once, so a game step is two plies:
+    the first (pending None) leaves state as it is and the second steps its action together with pending,
+    the action of the first. plies at odd depths below the root are first plies
+    '''
+    if pending == None:
+        return state
+    return game.step(step_actions(player, action, pending), True, *state[:-1])
+
+
+def _pending(node):
+    '''
+    pending action of the ply into node, its parent's action if node is a second ply and None otherwise
+    '''
+    return node.parent.action if node.depth % 2 == 0 else None
+
+# %%
+class StateCache:
+    '''
+    bounded lru of materialized node states.
+    nodes created with a cache only keep the action from their parent, their state is rebuilt on demand
+    by replaying actions from the nearest ancestor that still has one
+    '''
+    def __init__(self, game, maxsize=4096):
+        self.game = game
+        self.maxsize = maxsize
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def put(self, node, state):
+        self._states[node] = state
+        self._states.move_to_end(node)
+        if len(self._states) > self.maxsize:
+            self._states.popitem(last=False)
+
+    def get(self, node):
+        if node in self._states:
+            self._states.move_to_end(node)
+            return self._states[node]
+
+        # walk up to the nearest ancestor with a state, then replay back down
+        path = []
+        current = node
+        while current._state == None and current not in self._states:
+            path.append(current)
+            current = current.parent
+        state = current.state
+        for n in reversed(path):
+            state = apply_action(self.game, state, n.player, n.action, _pending(n))
+            self.put(n, state)
+        return state
 
 # %%
 class Node:
-    def __init__(self, state, parent = None, player=None, action=None):
-        self.state = state
+    def __init__(self, state, parent = None, player=None, action=None, cache=None):
         self.parent = parent
         self.player = player
         self.action = action
         self.visit_count = 0
         self.total_reward = 0
-        self.uct = np.inf
         self.children = []
+        # action taken from this node to reach each child, a shared child may have another parent
+        self.child_actions = []
+        # child_actions as a mask, bit a is set once action a has a child
+        self.child_mask = 0
         self.fully_expanded = False
+        self.hash = None
+        self.depth = 0 if parent == None else parent.depth + 1
+        # with a cache the node does not hold its state
+        self.cache = cache
+        self._state = None
+        if cache == None:
+            self._state = state
+        elif state != None:
+            cache.put(self, state)
 
-    def add_child(self, child):
+    @property
+    def state(self):
+        if self._state != None or self.cache == None:
+            return self._state
+        return self.cache.get(self)
+
+    @state.setter
+    def state(self, state):
+        self._state = state
+
+    def add_child(self, child, action=None):
         self.children.append(child)
+        action = child.action if action == None else action
+        self.child_actions.append(action)
+        self.child_mask |= 1 << int(action)
 
     def update(self, reward):
         self.total_reward += reward
@@ -31,6 +163,17 @@ class Node:
     def value(self):
         return self.total_reward/self.visit_count if self.visit_count > 0 else np.inf
 
+    def ucb(self, parent_visits):
+        if self.visit_count == 0:
+            return self.value
+        return self.value + math.sqrt(2*math.log(parent_visits)/self.visit_count)
+
+    @property
+    def uct(self):
+        if self.parent == None:
+            return self.value
+        return self.ucb(self.parent.visit_count)
+
     @property
     def is_root(self):
         return self.parent == None
@@ -38,112 +181,395 @@ class Node:
     @property
     def has_children(self):
         return len(self.children) > 0
-    
+
 # %%
-def update_uct(children):
-    for c in children:
-        c.uct = c.value + np.sqrt(2*np.log(c.parent.visit_count)/c.visit_count)
-        if c.has_children:
-            update_uct(c.children)
+class TranspositionTable:
+    '''
+    nodes keyed by (zobrist hash, depth, player that moved into the node), so positions reached through
+    different move orders share one node and its statistics. keying on depth keeps the graph acyclic.
+    children are stepped through Zobrist.step, which rehashes only the cells the engine reports changed,
+    only a root without a hash is hashed in full
+    '''
+    def __init__(self, board_width):
+        self.zobrist = Zobrist(board_width)
+        self.nodes = {}
 
-#%%
-def update_uct2(root):
-    current = root
-    stack = []
-    all_nodes = []
+    def __len__(self):
+        return len(self.nodes)
 
-    while True:
-        for child in current.children:
-            all_nodes.append(child)
-            stack.append(child)
-        if len(stack) > 0:
-            current = stack.pop()
+    def child(self, game, node, player, action, cache=None):
+        '''
+        (child, state) reached from node by player taking action, the child is created if the position is new
+        '''
+        if node.hash == None:
+            layers = game.unpack_board_state(node.state) if isinstance(game, PackedBMBoard) else node.state
+            node.hash = self.zobrist.hash(layers)
+        if node.depth % 2 == 0:
+            # a first ply leaves the state as it is, its action is part of the key until the step is played
+            state, h = node.state, node.hash
+            key = (h, node.depth + 1, player, action)
         else:
-            break
+            state, h = self.zobrist.step(game, step_actions(player, action, node.action), node.state, node.hash)
+            key = (h, node.depth + 1, player)
+        child = self.nodes.get(key)
+        if child == None:
+            child = Node(state=state, parent=node, player=player, action=action, cache=cache)
+            child.hash = h
+            self.nodes[key] = child
+        return child, state
+
+#%%
+def heuristic_value(game, state, health_weight=0.6, ammo_weight=0.1, danger_weight=0.3):
+    '''
+    leaf evaluator for iterate, scores an unfinished BMBoard state from -1 to 1 for player 1 from the
+    health and ammo differences in player_meta and how exposed each player is to fire and pending blasts
+    (BMBoard.exposure), so it works on the states of every engine.
+    use functools.partial to change the weights
+    '''
+    meta = state[5]
+    h1, h2 = meta[0, 1], meta[1, 1]
+    a1, a2 = meta[0, 2], meta[1, 2]
+    health = (h1 - h2)/max(h1 + h2, 1)
+    ammo = (a1 - a2)/max(a1 + a2, 1)
+    fuses = game.bomb_fuses(state)
+    danger = game.exposure(1, state, fuses) - game.exposure(2, state, fuses)
+    return max(-1.0, min(1.0, health_weight*health + ammo_weight*ammo - danger_weight*danger))
 
-    return all_nodes
 
 #%%
-def run(game, root, n=1000):
+class SearchStats:
+    '''
+    per phase timings and counts collected by run / run_timed when passed as stats.
+    times are summed seconds, expansion covers valid actions and stepping the new state,
+    rollout includes setting up the scratch board on the start state, which is also timed on its own as setup.
+    callback, if given, is called with the stats after every iteration
+    '''
+    phases = ('selection', 'expansion', 'rollout', 'setup', 'backprop')
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.iterations = 0
+        self.expansions = 0
+        self.rollout_steps = 0
+        self.max_depth = 0
+        self.nodes = 0
+        self.times = {phase: 0.0 for phase in self.phases}
+
+    def record(self, depth, times, rollout_steps=None):
+        '''
+        add one iteration, rollout_steps is None when the iteration expanded nothing
+        '''
+        self.iterations += 1
+        if rollout_steps != None:
+            self.expansions += 1
+            self.rollout_steps += rollout_steps
+        self.max_depth = max(self.max_depth, depth)
+        for phase, t in times.items():
+            self.times[phase] += t
+        if self.callback != None:
+            self.callback(self)
+
+    def record_tree(self, root):
+        '''
+        count the distinct nodes below root, shared nodes are counted once
+        '''
+        seen = {id(root)}
+        stack = [root]
+        while len(stack) > 0:
+            for child in stack.pop().children:
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+        self.nodes = len(seen)
+
+    def summary(self):
+        '''
+        totals and per iteration means as a dict
+        '''
+        n = max(self.iterations, 1)
+        total = sum(t for phase, t in self.times.items() if phase != 'setup')
+        return {
+            'iterations': self.iterations,
+            'expansions': self.expansions,
+            'nodes': self.nodes,
+            'max_depth': self.max_depth,
+            'rollout_steps_mean': self.rollout_steps/max(self.expansions, 1),
+            'time': dict(self.times),
+            'time_per_iteration': {phase: t/n for phase, t in self.times.items()},
+            'time_share': {phase: t/total if total > 0 else 0.0 for phase, t in self.times.items()}
+        }
+
+
+def _no_clock():
+    return 0.0
+
+
+def rollout(game, state, random, evaluator=None, rollout_depth=11, prune=False, first=None, clock=_no_clock):
+    '''
+    value of state for player 1 after random actions until the game is done or rollout_depth steps, see iterate.
+    steps are played in place on the state's own layers through a scratch board and undone once the final
+    state is scored. first is a (player, action) still to be played in the first step, e.g. a first ply's.
+    returns the value, the number of steps and clock() once the scratch board was set up
+    '''
+    board = game.scratch_board(state)
+    t_setup = clock()
+    steps = 0
+    unplayed, first_action = (None, None) if first == None else first
+    while board.done == False and steps < rollout_depth:
+        rollout_actions = []
+        for p in (1, 2):
+            if p == unplayed:
+                rollout_actions.append((p, first_action))
+            elif prune:
+                rollout_actions.append((p, board.random_safe_action(p, board.board_state, random.index, board.fuses)))
+            else:
+                rollout_actions.append((p, random.index(5)))
+        board.apply(rollout_actions)
+        unplayed = None
+        steps += 1
+
+    # a win is worth 1, unfinished games are left to the evaluator
+    final = board.board_state
+    meta = final[-2]
+    winner = meta[meta[:, 1] > 0, 0]
+    if len(winner) == 1:
+        value = 1 if winner.item() == 1 else -1
+    elif final[-1] or evaluator == None:
+        value = 0
+    else:
+        value = evaluator(game, final)
+    for _ in range(steps):
+        board.undo()
+    return value, steps, t_setup
+
+
+def iterate(game, root, table=None, cache=None, stats=None, random=None, evaluator=None, rollout_depth=11, prune=False):
+    '''
+    one select, expand, rollout and backpropagate pass from root.
+    pass a SearchStats as stats to time each phase.
+    random is the RandomBuffer random actions are drawn from, see random_buffer.
+    rollouts stop after rollout_depth random steps, evaluator(game, state) then scores a game that is
+    still running from -1 to 1 for player 1, e.g. heuristic_value. without one it scores 0.
+    with prune, nodes are expanded from game.safe_action_mask and rollout actions drawn with game.random_safe_action
+    instead of from every action
+    '''
+    if random == None:
+        random = random_buffer()
+    clock = _no_clock if stats == None else time.perf_counter
+    t_select = clock()
+    current_node = root
+    path = [root]
+
+    # select best path
+    while current_node.has_children and current_node.fully_expanded:
+        children = current_node.children
+        current_node = children[np.argmax([c.ucb(current_node.visit_count) for c in children])]
+        path.append(current_node)
+
+    # which player is going to make an action
+    player = 1 if current_node.player == None or current_node.player == 2 else 2
+
+    # valid actions that have not been taken from current_node yet
+    t_expand = clock()
+    state = current_node.state
+    valid_mask = game.safe_action_mask(player, state) if prune else game.legal_action_mask(player, state)
+    available_mask = valid_mask & ~current_node.child_mask
+
+    # reached end state of best path
+    if available_mask == 0:
+        # check if the node will be fully expanded after this action is taken
+        current_node.fully_expanded = valid_mask == current_node.child_mask
+        if stats != None:
+            stats.record(len(path) - 1, {'selection': t_expand - t_select, 'expansion': clock() - t_expand})
+        return
+
+    action = random.choice(mask_to_actions(available_mask))
+
+    # take the action to generate a new state and add the new node to its parent (current_node),
+    # a game step is two plies and only the second one steps the state (apply_action)
+    if table == None:
+        pending = current_node.action if current_node.depth % 2 == 1 else None
+        new_state = apply_action(game, state, player, action, pending)
+        new_node = Node(state=new_state, parent=current_node, player=player, action=action, cache=cache)
+    else:
+        new_node, new_state = table.child(game, current_node, player, action, cache)
+    current_node.add_child(new_node, action)
+
+    # set current_node to new node for simulation
+    current_node = new_node
+    path.append(current_node)
+
+    t_rollout = clock()
+    # the action of a first ply is played in the first rollout step
+    first = (player, action) if new_node.depth % 2 == 1 else None
+    value, _iter, t_setup = rollout(game, new_state, random, evaluator, rollout_depth, prune, first, clock)
+
+    # update nodes along the selected path
+    t_backprop = clock()
+    for node in path:
+        node.update(value if node.player == 1 else -value)
+
+    if stats != None:
+        stats.record(len(path) - 1, {
+            'selection': t_expand - t_select,
+            'expansion': t_rollout - t_expand,
+            'rollout': t_backprop - t_rollout,
+            'setup': t_setup - t_rollout,
+            'backprop': clock() - t_backprop
+        }, _iter)
+
+
+def best_root_action(root):
+    '''
+    action of the most visited root child
+    '''
+    best_child_idx = np.argmax([c.visit_count for c in root.children])
+    return root.child_actions[best_child_idx]
+
+
+def run(game, root, n=1000, table=None, cache=None, stats=None, rng=None, evaluator=None, rollout_depth=11, prune=False):
+    '''
+    search from root for n iterations and return the most visited action.
+    pass a TranspositionTable as table to share nodes between transposed positions.
+    pass a StateCache as cache to keep states out of new nodes and rebuild them on demand.
+    pass a SearchStats as stats to profile the search phases and the tree size.
+    pass a seed, np.random.Generator or RandomBuffer as rng to make the search repeatable on its own.
+    evaluator and rollout_depth set how leaves are scored, see iterate.
+    prune leaves out actions that walk into fire or blasts the player cannot escape, see iterate.
+    '''
+    random = random_buffer(rng)
     for _ in range(n):
-        current_node = root
+        iterate(game, root, table, cache, stats, random, evaluator, rollout_depth, prune)
+    if stats != None:
+        stats.record_tree(root)
+    return best_root_action(root)
 
-        # select best path
-        while current_node.has_children and current_node.fully_expanded:
-            children = current_node.children
-            current_node = children[np.argmax([c.uct for c in children])]
 
-        # which player is going to make an action
-        player = 1 if current_node.player == None or current_node.player == 2 else 2
+def run_timed(game, root, time_budget_ms, table=None, cache=None, should_stop=None, stats=None, rng=None,
+              evaluator=None, rollout_depth=11, prune=False):
+    '''
+    anytime search from root, iterates until time_budget_ms of wall clock time is spent or
+    should_stop() returns true (e.g. threading.Event.is_set), at least one iteration always runs.
+    stats, rng, evaluator, rollout_depth and prune are as in run.
+    returns a dict with the most visited action, the iterations completed, iterations per second
+    and the visit count of each root action
+    '''
+    t0 = time.perf_counter()
+    deadline = t0 + time_budget_ms/1000
+    iterations = 0
+    random = random_buffer(rng)
+    while True:
+        iterate(game, root, table, cache, stats, random, evaluator, rollout_depth, prune)
+        iterations += 1
+        if time.perf_counter() >= deadline or (should_stop != None and should_stop()):
+            break
+    elapsed = time.perf_counter() - t0
+    if stats != None:
+        stats.record_tree(root)
 
-        # all valid actions
-        valid_actions = game.valid_actions(player, current_node.state)
-        actions_taken = [n.action for n in current_node.children if n.action != None]
-        actions_available = list(set(valid_actions) - set(actions_taken))
+    return {
+        'action': best_root_action(root) if root.has_children else None,
+        'iterations': iterations,
+        'iterations_per_sec': iterations/elapsed if elapsed > 0 else np.inf,
+        'visits': {a: c.visit_count for a, c in zip(root.child_actions, root.children)}
+    }
 
-        # reached end state of best path - break
-        if len(actions_available) == 0:
-            # check if the node will be fully expanded after this action is taken
-            current_node.fully_expanded = set(valid_actions) == set(actions_taken)  
-            continue
+#%%
+def same_state(state, other):
+    '''
+    whether two board states of the same engine hold the same layers
+    '''
+    return all(np.array_equal(a, b) for a, b in zip(state, other))
 
-        # what actions have been taken from current_node 
-        action = np.random.choice(actions_available)
 
-        # take the action to generate a new state    
-        if player == 1:
-            new_state = game.step([(1, action), (2, Actions.NONE.value)], True, *current_node.state[:-1])
+def advance_root(root, actions, state, table=None):
+    '''
+    move the search root down the tree along the actions played, one tree ply per action, keeping the
+    statistics below it and detaching the rest of the tree.
+    a game step is two plies (apply_action), pass both actions of every step played, the action of the
+    player to move at root first, e.g. [p1_action, p2_action] for a root with player None.
+    state is the real board state after those actions, a fresh root is returned when that line was
+    never searched or its node does not hold state.
+    pass the TranspositionTable used by run as table to drop the nodes that are no longer reachable.
+    '''
+    node = root
+    player = root.player
+    for action in actions:
+        player = 1 if player == None or player == 2 else 2
+        if node != None and action in node.child_actions:
+            node = node.children[node.child_actions.index(action)]
         else:
-            new_state = game.step([(1, Actions.NONE.value), (2, action)], True, *current_node.state[:-1])
-
-        # add the new node to its parent (current_node)
-        new_node = Node(state=new_state, parent=current_node, player=player, action=action)
-        current_node.add_child(new_node)
-
-        # set current_node to new node for simulation
-        current_node = new_node
-
-        # make random actions until done
-        _state = deepcopy(current_node.state)
-        _iter = 0
-        while _state[-1] == False:
-            #va1 = game.valid_actions(1, _state)
-            #va2 = game.valid_actions(2, _state)
-            #ra1 = np.random.choice(va1)
-            #ra2 = np.random.choice(va2)
-            ra1 = np.random.choice([0,1,2,3,4])
-            ra2 = np.random.choice([0,1,2,3,4])
-            _state = game.step([(1, ra1), (2, ra2)], True, *_state[:-1])
-            _iter += 1
-            if _iter > 10:
-                #print('stuck')
-                break
-
-        # get winner id
-        meta = _state[-2]
-        winner = meta[meta[:, 1] > 0, 0]
-        winner_id = winner.item() if len(winner) == 1 else None
-
-        # update parents
-        parent = current_node
-        while parent != None:
-            reward = 1 if winner_id == parent.player else -1
-            if winner_id == None: reward = 0
-            parent.update(reward)
-            parent = parent.parent
-
-        # recalculate uct
-        all_nodes = update_uct2(root)
-        for c in all_nodes:
-            c.uct = c.value + math.sqrt(2*math.log(c.parent.visit_count)/c.visit_count)
+            node = None
 
-    best_child_idx = np.argmax([c.visit_count for c in root.children])
-    best_child = root.children[best_child_idx]
-    best_action = best_child.action
+    if node == None or not same_state(node.state, state):
+        if table != None:
+            table.nodes.clear()
+        return Node(state, player=player)
+
+    # the detached root can no longer replay its state from a parent
+    node.state = state
+    node.parent = None
+
+    # collect what is still reachable, shared nodes may point at a parent that was dropped
+    retained = {id(node): node}
+    stack = [node]
+    while len(stack) > 0:
+        current = stack.pop()
+        for child in current.children:
+            if id(child) not in retained:
+                retained[id(child)] = child
+                stack.append(child)
+    for current in retained.values():
+        for action, child in zip(current.child_actions, current.children):
+            if child.parent == None or id(child.parent) not in retained:
+                child.parent = current
+                child.action = action
+
+    if table != None:
+        table.nodes = {key: n for key, n in table.nodes.items() if id(n) in retained}
+
+    return node
+
+#%%
+def _run_worker(game, n, seed):
+    '''
+    one independent search for run_parallel, returns (action, visit_count, total_reward) for each root child
+    '''
+    root = Node(game.board_state)
+    run(game, root, n, rng=seed)
+    return [(a, c.visit_count, c.total_reward) for a, c in zip(root.child_actions, root.children)]
+
+
+def run_parallel(game, n_iterations=1000, workers=None, seed=None, pool=None):
+    '''
+    root parallel search. runs one search of n_iterations per worker from game.board_state,
+    each with its own seed, then merges the root children statistics to pick the action.
+    pass an open ProcessPoolExecutor as pool to avoid starting processes on every call.
+    '''
+    workers = workers or os.cpu_count()
+    seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(workers)]
+    args = ([game]*workers, [n_iterations]*workers, seeds)
+    if pool is None:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_run_worker, *args))
+    else:
+        results = list(pool.map(_run_worker, *args))
+
+    # merge root children, most visits wins and total reward breaks ties
+    visits = {}
+    rewards = {}
+    for result in results:
+        for action, visit_count, total_reward in result:
+            visits[action] = visits.get(action, 0) + visit_count
+            rewards[action] = rewards.get(action, 0) + total_reward
+
+    best_action = max(visits, key=lambda a: (visits[a], rewards[a]))
     return best_action
 
 #%%
 def render_board_state(boards):
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
     cm = ListedColormap(["grey", "blue", "red", "saddlebrown", "black", "yellow"])
     eb = boards[0].copy()
     bb = boards[1].copy()
@@ -154,19 +580,27 @@ def render_board_state(boards):
 
 
 #%%
-game = BMBoard(5, 1, 1000)
-render_board_state(game.board_state)
+# example cells, only run as a script or in an interactive window, never on import
+if __name__ == '__main__':
+    game = BMBoard(5, 1, 1000)
+    render_board_state(game.board_state)
 
 #%%
-t1 = time.time()
-root = Node(game.board_state)
-best_action = run(game, root, 100)
-game.step([(1, best_action), (2, Actions.NONE.value)])  
-print(time.time() - t1)
-render_board_state(game.board_state)
+if __name__ == '__main__':
+    t1 = time.time()
+    root = Node(game.board_state)
+    for _ in range(5):
+        if game.done:
+            break
+        best_action = run(game, root, 100)
+        reply = np.random.choice(game.valid_actions(2, game.board_state))
+        game.step([(1, best_action), (2, reply)])
+        root = advance_root(root, [best_action, reply], game.board_state)
+        print('reused visits', root.visit_count)
+    print(time.time() - t1)
+    render_board_state(game.board_state)
 
 #%%
-# root = Node(game.board_state)
 # best_action = run(game, root, 1000)
 # game.step(np.array([(1, best_action), (2, Actions.LEFT.value)], dtype=np.int_))  
 # render_board_state(game.board_state)
\ No newline at end of file
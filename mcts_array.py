@@ -0,0 +1,174 @@
+import numpy as np
+from bm import Actions, mask_to_actions
+from mcts import apply_action, random_buffer, rollout
+
+# one child slot per action value, the layout of mcts_numba.N_SLOTS
+N_SLOTS = Actions.NONE.value + 1
+
+
+class ArrayTree:
+    '''
+    mcts tree stored as preallocated parallel arrays indexed by node id, node 0 is the root.
+    children[i, a] is the child reached from node i by action a, -1 marks no node. this is the layout
+    the mcts_numba search kernels work on, pass arrays to them (see mcts_parallel.run_threaded).
+    player 0 means no player has moved into the node (the root).
+    states[i] is the board state of node i for run, the compiled searches replay their states from the root
+    and store none
+    '''
+    def __init__(self, root_state=None, capacity=1024):
+        self.size = 0
+        self.children = np.full((capacity, N_SLOTS), -1, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.action = np.full(capacity, -1, dtype=np.int64)
+        self.player = np.zeros(capacity, dtype=np.int64)
+        self.visit_count = np.zeros(capacity, dtype=np.int64)
+        self.total_reward = np.zeros(capacity, dtype=np.float64)
+        # in flight visits of the threads sharing the tree
+        self.virtual_loss = np.zeros(capacity, dtype=np.int64)
+        self.fully_expanded = np.zeros(capacity, dtype=np.bool_)
+        # state pool, states[i] is the board state of node i
+        self.states = {}
+        self.add_node(root_state)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.parent)
+
+    @property
+    def arrays(self):
+        '''
+        the arrays in the order of the mcts_numba.search_iterations arguments
+        '''
+        return self.children, self.parent, self.action, self.player, self.visit_count, self.total_reward, self.virtual_loss
+
+    def _grow(self, capacity):
+        '''
+        extend every array to capacity
+        '''
+        extra = capacity - self.capacity
+        self.children = np.concatenate([self.children, np.full((extra, N_SLOTS), -1, dtype=np.int64)])
+        self.parent = np.concatenate([self.parent, np.full(extra, -1, dtype=np.int64)])
+        self.action = np.concatenate([self.action, np.full(extra, -1, dtype=np.int64)])
+        self.player = np.concatenate([self.player, np.zeros(extra, dtype=np.int64)])
+        self.visit_count = np.concatenate([self.visit_count, np.zeros(extra, dtype=np.int64)])
+        self.total_reward = np.concatenate([self.total_reward, np.zeros(extra, dtype=np.float64)])
+        self.virtual_loss = np.concatenate([self.virtual_loss, np.zeros(extra, dtype=np.int64)])
+        self.fully_expanded = np.concatenate([self.fully_expanded, np.zeros(extra, dtype=np.bool_)])
+
+    def reserve(self, n):
+        '''
+        hand out the next n node ids as a block, growing the arrays to fit, returns the first id.
+        the compiled searches fill their block themselves, ids they do not use stay unlinked
+        '''
+        first = self.size
+        if first + n > self.capacity:
+            capacity = self.capacity
+            while first + n > capacity:
+                capacity *= 2
+            self._grow(capacity)
+        self.size += n
+        return first
+
+    def add_node(self, state, parent=-1, player=0, action=-1):
+        '''
+        store a new node and link it as the child of parent for action, returns its id
+        '''
+        idx = self.reserve(1)
+        self.parent[idx] = parent
+        self.action[idx] = action
+        self.player[idx] = player
+        self.states[idx] = state
+        if parent >= 0:
+            self.children[parent, action] = idx
+        return idx
+
+    def child_mask(self, idx):
+        '''
+        int mask with bit a set once action a has a child of node idx
+        '''
+        mask = 0
+        for a in np.flatnonzero(self.children[idx] >= 0).tolist():
+            mask |= 1 << a
+        return mask
+
+    def value(self, idx):
+        return self.total_reward[idx]/self.visit_count[idx] if self.visit_count[idx] > 0 else np.inf
+
+    def select_child(self, idx):
+        '''
+        child of node idx with the highest uct, unvisited children first
+        '''
+        children = self.children[idx]
+        children = children[children >= 0]
+        visits = self.visit_count[children]
+        if visits.min() == 0:
+            return children[visits.argmin()]
+        uct = self.total_reward[children]/visits + np.sqrt(2*np.log(self.visit_count[idx])/visits)
+        return children[uct.argmax()]
+
+    def backpropagate(self, idx, value):
+        '''
+        add a rollout value for player 1 to node idx and all its ancestors, as mcts.iterate does
+        '''
+        while idx >= 0:
+            self.total_reward[idx] += value if self.player[idx] == 1 else -value
+            self.visit_count[idx] += 1
+            idx = self.parent[idx]
+
+    def root_stats(self):
+        '''
+        (action, visit_count, total_reward) for each expanded child of the root
+        '''
+        return [(a, int(self.visit_count[c]), float(self.total_reward[c])) for a, c in enumerate(self.children[0].tolist()) if c >= 0]
+
+    def best_action(self):
+        '''
+        action of the most visited root child
+        '''
+        return max(self.root_stats(), key=lambda s: s[1])[0]
+
+
+def run(game, tree, n=1000, rng=None, evaluator=None, rollout_depth=11, prune=False):
+    '''
+    mcts.run on an ArrayTree, the plies, expansion and rollouts are mcts.iterate's (apply_action, rollout).
+    returns the most visited action from the root
+    '''
+    random = random_buffer(rng)
+    for _ in range(n):
+        current = 0
+        depth = 0
+
+        # select best path
+        while tree.fully_expanded[current]:
+            current = tree.select_child(current)
+            depth += 1
+
+        # which player is going to make an action
+        player = 1 if tree.player[current] != 1 else 2
+        state = tree.states[current]
+
+        # valid actions that have not been taken from current yet
+        valid_mask = game.safe_action_mask(player, state) if prune else game.legal_action_mask(player, state)
+        child_mask = tree.child_mask(current)
+        available_mask = valid_mask & ~child_mask
+
+        # reached end state of best path
+        if available_mask == 0:
+            tree.fully_expanded[current] = valid_mask == child_mask
+            continue
+
+        action = random.choice(mask_to_actions(available_mask))
+
+        # a game step is two plies and only the second one steps the state
+        pending = int(tree.action[current]) if depth % 2 == 1 else None
+        new_state = apply_action(game, state, player, action, pending)
+        current = tree.add_node(new_state, current, player, action)
+
+        first = (player, action) if pending == None else None
+        value, _, _ = rollout(game, new_state, random, evaluator, rollout_depth, prune, first)
+        tree.backpropagate(current, value)
+
+    return tree.best_action()
@@ -1,227 +1,203 @@
 # %%
-from logging import debug
-from bm import BMBoard
-from typing import Tuple
-
-from numba.typed import typedlist
-from bm_numba import BMBoardNumba, Actions, Entities
+import math
 import numpy as np
-from copy import deepcopy
 import numba
-from numba import types, deferred_type, optional, typed
+import time
+import bm_numba
+from bm_numba import BMBoard, Actions, Entities, step_kernel, legal_action_mask_kernel
 
 # %%
-node_type = deferred_type()
-
-spec = [
-    ('state', types.Tuple([
-        types.Array(numba.int_, 2, 'C'),
-        types.Array(numba.int_, 2, 'C'),
-        types.Array(numba.int_, 2, 'C'),
-        types.Array(numba.int_, 2, 'C'),
-        types.Array(numba.int_, 2, 'C'),
-        types.Array(numba.int_, 2, 'C'),
-        numba.boolean
-    ])),
-    ('parent', optional(node_type)),
-    ('player', optional(numba.int_)),
-    ('action', numba.int_),
-    ('visit_count', numba.int_),
-    ('total_reward', numba.int_),
-    ('uct', numba.int_),
-    ('left_child', optional(node_type)),
-    ('right_child', optional(node_type)),
-    ('sibling', optional(node_type)),
-    ('fully_expanded', numba.boolean)
-]
-
-@numba.experimental.jitclass(spec)
-class Node:
-    def __init__(self, state, parent=None, player=None, action=999):
-        self.state = state
-        self.parent = parent
-        self.player = player
-        self.action = action
-        self.visit_count = 0
-        self.total_reward = 0
-        self.uct = 999999
-        self.left_child = None
-        self.right_child = None
-        self.sibling = None
-        self.fully_expanded = False
-        if parent is not None:
-            parent.add_child(self)
-
-    def update(self, reward):
-        self.total_reward += reward
-        self.visit_count += 1
-
-    def add_sibling(self, sibling):
-        self.sibling = sibling
-
-    def add_child(self, child):
-        child.parent = self
-        # if parent has no children
-        if self.left_child is None:
-            # this node is it first child
-            self.left_child = child
-            self.right_child = child
-        else:
-            # the last (now right) child will have this node as sibling
-            self.right_child.add_sibling(child)
-            self.right_child = child
-
-    @property
-    def children(self):
-        """ A list with all children. """
-        children = []
-        child = self.left_child
-        while child is not None:
-            children.append(child)
-            child = child.sibling
-        return children
-
-    @property
-    def value(self):
-        return self.total_reward/self.visit_count if self.visit_count > 0 else 999999
-
-    @property
-    def is_root(self):
-        return self.parent is None
-
-    @property
-    def has_children(self):
-        return len(self.children) > 0
-    
-node_type.define(Node.class_type.instance_type)
-
-#%%
-game = BMBoardNumba(4, 1, 1000)
-root = Node(game.board_state)
-print(root.is_root)
-game.render()
-
-#%%
-root.add_child(Node(game.board_state))
-root.add_child(Node(game.board_state))
-root.children
-
+# one child slot per action value, children[i, a] is the child reached by action a
+N_SLOTS = 7
+
+# the kernels take the engine tuple of a bm_numba.BMBoard rather than the board itself, functions that
+# take a jitclass can not be cached on disk
+
+
+@numba.njit(cache=True, nogil=True)
+def winner_id(player_meta):
+    '''
+    id of the only player left alive, 0 if there is none
+    '''
+    winner = 0
+    n_alive = 0
+    for i in range(player_meta.shape[0]):
+        if player_meta[i, 1] > 0:
+            winner = player_meta[i, 0]
+            n_alive += 1
+    return winner if n_alive == 1 else 0
+
+
+@numba.njit(cache=True, nogil=True)
+def apply_action(engine, state, player, action):
+    '''
+    step state with player taking action while the other player does nothing
+    '''
+    if player == 1:
+        actions = np.array([[1, action], [2, Actions.NONE.value]], dtype=np.int_)
+    else:
+        actions = np.array([[1, Actions.NONE.value], [2, action]], dtype=np.int_)
+    return step_kernel(engine, actions, state[0], state[1], state[2], state[3], state[4], state[5], state[6])
+
+
+@numba.njit(cache=True, nogil=True)
+def rollout(engine, state, max_steps=11):
+    '''
+    play random actions from state until done or max_steps, returns the winner id
+    '''
+    board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = state
+    steps = 0
+    while not done and steps < max_steps:
+        actions = np.array([[1, np.random.randint(5)], [2, np.random.randint(5)]], dtype=np.int_)
+        board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done = step_kernel(
+            engine, actions, board, bombs_board, fire_board, ammo_board, powerup_board, player_meta, done)
+        steps += 1
+    return winner_id(player_meta)
 
 # %%
-def update_uct(children):
-    for c in children:
-        c.uct = c.value + np.sqrt(2*np.log(c.parent.visit_count)/c.visit_count)
-        if c.has_children:
-            update_uct(c.children)
-
-#%%
-@numba.njit
-def update_uct2(root):
-    current = root
-    stack = []
-    all_nodes = []
-
-    while True:
-        for child in current.children:
-            all_nodes.append(child)
-            stack.append(child)
-        if len(stack) > 0:
-            current = stack.pop()
-        else:
-            break
-
-    return all_nodes
-
-
-#%%
-#@numba.jit
-def run(game, root, n=1000):
-    for i in np.arange(n):
-        current_node = root
-
-        # select best path
-        while current_node.has_children and current_node.fully_expanded:
-            children = current_node.children
-            current_node = children[np.argmax(np.array([c.uct for c in children], dtype=np.int_))]
-
-        # which player is going to make an action
-        player = 1 if current_node.player == None or current_node.player == 2 else 2
-
-        # all valid actions
-        valid_actions = game.valid_actions(player, current_node.state)
-        
-        actions_taken = np.array([n.action for n in current_node.children if n.action != 999], dtype=np.int_)
-        actions_available = np.array(list(set(valid_actions) - set(actions_taken)), dtype=np.int_)
-
-        # reached end state of best path - break
-        if len(actions_available) == 0:
-            # check if the node will be fully expanded after this action is taken
-            current_node.fully_expanded = set(valid_actions) == set(actions_taken)  
-            continue
-
-        # what actions have been taken from current_node 
-        action = np.random.choice(actions_available)
-
-        # take the action to generate a new state    
-        if player == 1:
-            new_state = game.step(np.array([(1, action), (2, BMBoard.Actions.NONE.value)], np.int_), True, *current_node.state[:-1])
-        else:
-            new_state = game.step(np.array([(1, BMBoard.Actions.NONE.value), (2, action)], np.int_), True, *current_node.state[:-1])
-
-        # add the new node to its parent (current_node)
-        new_node = Node(state=new_state, parent=current_node, player=player, action=action)
-        current_node.add_child(new_node)
-
-        # set current_node to new node for simulation
-        current_node = new_node
-
-        # make random actions until done
-        _state = deepcopy(current_node.state)
-        _iter = 0
-        while _state[-1] == False:
-            va1 = game.valid_actions(1, _state)
-            va2 = game.valid_actions(2, _state)
-            ra1 = np.random.choice(va1)
-            ra2 = np.random.choice(va2)
-            _state = game.step(np.array([(1, ra1), (2, ra2)], np.int_), True, *_state[:-1])
-            _iter += 1
-            if _iter > 1000:
-                print('stuck')
+@numba.njit(cache=True, nogil=True)
+def search_iterations(engine, root_state, children, parent, action, player, visit_count, total_reward, virtual_loss,
+                      first_node, n_iterations, virtual_loss_weight, seed):
+    '''
+    n_iterations of select, expand, rollout and backpropagate on an array tree with node 0 as the root.
+    states are not stored, they are rebuilt by replaying actions from root_state on the way down.
+    new nodes take ids first_node, first_node+1, ... and the number of nodes added is returned.
+    virtual_loss counts in-flight visits as losses when several threads share the tree.
+    '''
+    np.random.seed(seed)
+    next_node = first_node
+    for _ in range(n_iterations):
+        node = 0
+        state = root_state
+        virtual_loss[node] += virtual_loss_weight
+
+        # select best path, stop after expanding one node or at a finished game
+        while not state[6]:
+            p = 1 if player[node] != 1 else 2
+            valid_mask = legal_action_mask_kernel(engine, p, state[0], state[1], state[5])
+
+            n_open = 0
+            open_actions = np.empty(N_SLOTS, dtype=np.int_)
+            for a in range(N_SLOTS):
+                if (valid_mask >> a) & 1 and children[node, a] < 0:
+                    open_actions[n_open] = a
+                    n_open += 1
+
+            if n_open > 0:
+                a = open_actions[np.random.randint(n_open)]
+                child = next_node
+                parent[child] = node
+                action[child] = a
+                player[child] = p
+                visit_count[child] = 0
+                total_reward[child] = 0
+                # another thread may have expanded the same action in the meantime
+                if children[node, a] < 0:
+                    children[node, a] = child
+                    next_node += 1
+                else:
+                    child = children[node, a]
+                state = apply_action(engine, state, p, a)
+                node = child
+                virtual_loss[node] += virtual_loss_weight
                 break
 
-        # get winner id
-        meta = _state[-2]
-        winner = meta[meta[:, 1] > 0, 0]
-        winner_id = winner.item() if len(winner) == 1 else None
-
-        # update parents
-        parent = current_node
-        while parent != None:
-            reward = 1 if winner_id == parent.player else -1
-            if winner_id == None: reward = 0
-            parent.update(reward)
-            parent = parent.parent
-
-        
-        #recalculate uct
-        all_nodes = update_uct2(root)
-        for c in all_nodes:
-            c.uct = c.value + np.sqrt(2*np.log(c.parent.visit_count)/c.visit_count)
-
-    best_child_idx = np.argmax(np.array([c.visit_count for c in root.children], dtype=np.int_))
-    best_child = root.children[best_child_idx]
-    best_action = best_child.action
+            best_child = -1
+            best_uct = -np.inf
+            parent_visits = max(visit_count[node] + virtual_loss[node], 1)
+            for a in range(N_SLOTS):
+                if not (valid_mask >> a) & 1:
+                    continue
+                c = children[node, a]
+                visits = visit_count[c] + virtual_loss[c]
+                if visits <= 0:
+                    uct = np.inf
+                else:
+                    uct = (total_reward[c] - virtual_loss[c])/visits + math.sqrt(2*math.log(parent_visits)/visits)
+                if uct > best_uct:
+                    best_uct = uct
+                    best_child = c
+
+            state = apply_action(engine, state, p, action[best_child])
+            node = best_child
+            virtual_loss[node] += virtual_loss_weight
+
+        winner = rollout(engine, state)
+
+        # update parents and release the virtual loss
+        while node >= 0:
+            visit_count[node] += 1
+            if winner != 0:
+                total_reward[node] += 1 if winner == player[node] else -1
+            virtual_loss[node] -= virtual_loss_weight
+            node = parent[node]
+
+    return next_node - first_node
+
+# %%
+@numba.njit(cache=True)
+def search_kernel(engine, root_state, n_iterations, seed, root_player):
+    '''
+    search on an engine tuple, see search
+    '''
+    capacity = n_iterations + 1
+    children = np.full((capacity, N_SLOTS), -1, dtype=np.int64)
+    parent = np.full(capacity, -1, dtype=np.int64)
+    action = np.full(capacity, -1, dtype=np.int64)
+    player = np.zeros(capacity, dtype=np.int64)
+    visit_count = np.zeros(capacity, dtype=np.int64)
+    total_reward = np.zeros(capacity, dtype=np.int64)
+    virtual_loss = np.zeros(capacity, dtype=np.int64)
+    # the root is entered by the other player
+    player[0] = 3 - root_player
+
+    search_iterations(engine, root_state, children, parent, action, player, visit_count, total_reward, virtual_loss,
+                      1, n_iterations, 0, seed)
+
+    root_actions = np.nonzero(children[0] >= 0)[0]
+    root_children = children[0][root_actions]
+    root_visits = visit_count[root_children]
+    root_rewards = total_reward[root_children]
+    best_action = root_actions[np.argmax(root_visits)]
+    return best_action, root_actions, root_visits, root_rewards
+
+
+def search(game, root_state, n_iterations, seed, root_player=1):
+    '''
+    compiled mcts from root_state on a bm_numba.BMBoard for the moves of root_player.
+    returns the most visited action and the actions, visit counts and total rewards of the root children
+    '''
+    return search_kernel(game.engine, root_state, n_iterations, seed, root_player)
+
+
+def warmup(board_width=5, jitclass=True):
+    '''
+    bm_numba.warmup plus the search kernels, returns the seconds it took.
+    with jitclass=False a process can search with search_kernel(bm_numba.make_engine(w), state, ...)
+    using only cached code
+    '''
+    t0 = time.perf_counter()
+    bm_numba.warmup(board_width, jitclass)
+    state = bm_numba.restart_state(board_width, 1, 1)
+    search_kernel(bm_numba.make_engine(board_width), state, 2, 0, 1)
+    return time.perf_counter() - t0
+
+
+def run(game, n=1000, seed=None, player=1):
+    '''
+    search from game.board_state for n iterations and return the most visited action of player
+    '''
+    if seed == None:
+        seed = np.random.randint(2**31)
+    best_action, root_actions, root_visits, root_rewards = search(game, game.board_state, n, seed, player)
     return best_action
 
 
 #%%
-game = BMBoardNumba(4, 1, 1000)
-#%%
-root = Node(game.board_state)
-best_action = run(game, root, 1000)
-game.step(np.array([[1, best_action], [2, Actions.LEFT.value]], dtype=np.int_))  
-print(game.board_state[-2])
-game.render()
-# %%
-
-# %%
+if __name__ == '__main__':
+    game = BMBoard(4, 1, 1000)
+    best_action, root_actions, root_visits, root_rewards = search(game, game.board_state, 1000, 0)
+    print(root_actions, root_visits, root_rewards)
+    game.step(np.array([[1, best_action], [2, Actions.LEFT.value]], dtype=np.int_))
+    print(game.board_state[-2])
+    print(game.render())
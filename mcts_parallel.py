@@ -0,0 +1,32 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mcts_array import ArrayTree
+from mcts_numba import search_iterations
+
+
+def run_threaded(game, n_iterations=1000, threads=4, seed=None, virtual_loss=1, tree=None):
+    '''
+    tree parallel search on a bm_numba.BMBoard from game.board_state.
+    every thread runs n_iterations on one shared tree, the search kernels release the gil.
+    pass an mcts_array.ArrayTree as tree to keep its statistics between calls from the same root state,
+    every call reserves threads*n_iterations more node ids from it.
+    threads update visit_count, total_reward and virtual_loss without locks, so concurrent updates of the
+    same node can be lost and the statistics are approximate. virtual_loss is cleared once the threads
+    are done so no stale penalty is left on the tree.
+    '''
+    if tree is None:
+        tree = ArrayTree(capacity=1 + threads*n_iterations)
+    first_node = tree.reserve(threads*n_iterations)
+    seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(threads)]
+    root_state = game.board_state
+
+    with ThreadPoolExecutor(threads) as pool:
+        futures = [
+            pool.submit(search_iterations, game.engine, root_state, *tree.arrays, first_node + t*n_iterations, n_iterations, virtual_loss, seeds[t])
+            for t in range(threads)
+        ]
+        for f in futures:
+            f.result()
+    tree.virtual_loss[:] = 0
+
+    return tree.best_action()
@@ -0,0 +1,186 @@
+import numpy as np
+import pytest
+from bm import BMBoard, Actions, mask_to_actions
+from bm_bitboard import BitBoard
+from bm_sparse import SparseBMBoard
+from bm_vec import VecBMBoard
+from zobrist import Zobrist
+
+
+def same_state(a, b):
+    return all(np.array_equal(x, y) for x, y in zip(a, b))
+
+def copy_state(board_states):
+    return tuple(layer.copy() if isinstance(layer, np.ndarray) else layer for layer in board_states)
+
+def random_actions(game, board_states, legal_only=True):
+    '''
+    one random action per player, with legal_only False every fifth action is drawn from all actions
+    '''
+    actions = []
+    for p in (1, 2):
+        if legal_only or np.random.rand() < .8:
+            actions.append((p, int(np.random.choice(mask_to_actions(game.legal_action_mask(p, board_states))))))
+        else:
+            actions.append((p, int(np.random.choice([a.value for a in Actions]))))
+    return actions
+
+def survives(game, board_states, player_id, depth):
+    '''
+    brute force, whether player_id can keep its health for depth more steps without bombing while the other player waits
+    '''
+    if depth == 0:
+        return True
+    row = game._meta_rows[player_id]
+    health = board_states[5][row, 1]
+    for a in mask_to_actions(game.legal_action_mask(player_id, board_states)):
+        if a == Actions.BOMB.value:
+            continue
+        new_states = game.step([(player_id, a), (3 - player_id, Actions.NONE.value)], True, *board_states[:-1])
+        if new_states[5][row, 1] == health and survives(game, new_states, player_id, depth - 1):
+            return True
+    return False
+
+
+#%%
+# danger board
+
+@pytest.mark.parametrize('use_apply', [False, True])
+def test_danger_board_matches_danger_map(use_apply):
+    game = BMBoard(6, 3, 6)
+    for seed in range(40):
+        np.random.seed(seed)
+        game.restart_board()
+        for _ in range(60):
+            if game.done:
+                break
+            actions = random_actions(game, game.board_state)
+            if use_apply:
+                game.apply(actions)
+            else:
+                game.step(actions)
+            assert np.array_equal(game.danger_board, game.danger_map(game.board_state))
+
+
+#%%
+# other engines against BMBoard
+
+@pytest.mark.parametrize('engine', [BitBoard, SparseBMBoard])
+@pytest.mark.parametrize('board_width', [5, 7, 9])
+def test_packed_engine_matches_bmboard(engine, board_width):
+    np.random.seed(board_width)
+    dense, packed = BMBoard(board_width, 3, 5), engine(board_width, 3, 5)
+    for _ in range(10):
+        state = dense.restart_board()
+        packed_state = packed.pack_board_state(state)
+        assert same_state(packed.unpack_board_state(packed_state), state)
+        for _ in range(40):
+            if state[-1]:
+                break
+            for p in (1, 2):
+                assert packed.legal_action_mask(p, packed_state) == dense.legal_action_mask(p, state)
+                assert packed.safe_action_mask(p, packed_state) == dense.safe_action_mask(p, state)
+                assert packed.exposure(p, packed_state) == dense.exposure(p, state)
+            assert np.array_equal(packed.danger_map(packed_state), dense.danger_map(state))
+            actions = random_actions(dense, state, legal_only=False)
+            previous = packed.unpack_board_state(packed_state)
+            state = dense.step(actions, True, *state[:-1])
+            next_state = packed.step(actions, True, *packed_state[:-1])
+            # steps never modify the state they start from
+            assert same_state(packed.unpack_board_state(packed_state), previous)
+            assert same_state(packed.unpack_board_state(next_state), state)
+            packed_state = next_state
+
+
+def test_vec_matches_bmboard():
+    np.random.seed(3)
+    n_games = 50
+    vec, dense = VecBMBoard(n_games, 7, 3, 6), BMBoard(7, 3, 6)
+    states = [vec.game_state(i) for i in range(n_games)]
+    for _ in range(30):
+        actions = np.random.choice([a.value for a in Actions], (n_games, 2))
+        vec.step(actions)
+        for i in range(n_games):
+            dense.done = states[i][-1]
+            states[i] = dense.step([(1, actions[i, 0]), (2, actions[i, 1])], True, *states[i][:-1])
+            vec_state = vec.game_state(i)
+            # VecBMBoard does not track positions in player_meta
+            assert same_state(states[i][:5], vec_state[:5])
+            assert np.array_equal(states[i][5][:, :4], vec_state[5][:, :4])
+            assert states[i][6] == vec_state[6]
+
+
+#%%
+# apply and undo
+
+@pytest.mark.parametrize('engine', [BMBoard, BitBoard, SparseBMBoard])
+def test_undo_restores_apply(engine):
+    np.random.seed(1)
+    game = engine(7, 3, 5)
+    for _ in range(5):
+        game.restart_board()
+        history = []
+        for _ in range(30):
+            if game.done:
+                break
+            history.append((copy_state(game.board_state), dict(game.fuses)))
+            game.apply(random_actions(game, game.board_state))
+        while len(history) > 0:
+            game.undo()
+            state, fuses = history.pop()
+            assert same_state(game.board_state, state)
+            assert game.fuses == fuses
+            assert np.array_equal(game.danger_board, game.danger_map(game.board_state))
+
+
+#%%
+# safe actions
+
+def test_safe_action_mask_matches_brute_force():
+    np.random.seed(1)
+    game = BMBoard(7, 3, 3)
+    for _ in range(15):
+        state = game.restart_board()
+        for _ in range(25):
+            if state[-1]:
+                break
+            for p in (1, 2):
+                legal = game.legal_action_mask(p, state)
+                safe = game.safe_action_mask(p, state)
+                assert safe & ~legal == 0
+                row = game._meta_rows[p]
+                truth = {}
+                for a in mask_to_actions(legal):
+                    new_states = game.step([(p, a), (3 - p, Actions.NONE.value)], True, *state[:-1])
+                    truth[a] = new_states[5][row, 1] == state[5][row, 1] and survives(game, new_states, p, 5)
+                # with no way out every action is left in the mask
+                if not any(truth.values()):
+                    continue
+                assert all(truth[a] == bool(safe >> a & 1) for a in truth)
+                rng = np.random.default_rng(0)
+                index = lambda n: int(rng.integers(n))
+                for _ in range(5):
+                    assert safe >> game.random_safe_action(p, state, index) & 1
+            state = game.step(random_actions(game, state), True, *state[:-1])
+
+
+#%%
+# zobrist hashing
+
+@pytest.mark.parametrize('engine', [BMBoard, BitBoard, SparseBMBoard])
+def test_zobrist_update_matches_hash(engine):
+    np.random.seed(2)
+    game = engine(7, 3, 6)
+    zobrist = Zobrist(7)
+    dense = (lambda s: s) if engine is BMBoard else game.unpack_board_state
+    for _ in range(10):
+        state = game.restart_board()
+        h = zobrist.hash(dense(state))
+        for _ in range(40):
+            if state[-1]:
+                break
+            actions = random_actions(game, state)
+            expected = game.step(actions, True, *state[:-1])
+            state, h = zobrist.step(game, actions, state, h)
+            assert same_state(dense(state)[:6], dense(expected)[:6])
+            assert h == zobrist.hash(dense(state))
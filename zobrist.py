@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class Zobrist:
+    '''
+    zobrist hashing of BMBoard board states
+
+    every (layer, value, y, x) cell of the five board layers and every (row, column, value) entry of
+    player_meta has a random 64 bit key, the hash of a state is the xor of all of them.
+    floor cells (value 0) have key 0, cell values must be below n_values.
+    '''
+    def __init__(self, board_width, n_values=16, seed=0):
+        self._rng = np.random.default_rng(seed)
+        self.cell_keys = self._rng.integers(0, 2**64, (5, n_values, board_width, board_width), dtype=np.uint64)
+        self.cell_keys[:, 0] = 0
+        # python ints for the per cell updates
+        self._cell_keys = self.cell_keys.tolist()
+        self._ys, self._xs = np.indices((board_width, board_width))
+        # player_meta values are unbounded (ammo), so their keys are drawn when first seen
+        self._meta_keys = {}
+
+    def _meta_key(self, row, col, value):
+        key = (row, col, value)
+        if key not in self._meta_keys:
+            self._meta_keys[key] = int(self._rng.integers(0, 2**64, dtype=np.uint64))
+        return self._meta_keys[key]
+
+    def hash(self, board_states):
+        '''
+        full hash of a board state
+        '''
+        h = 0
+        for layer, board in enumerate(board_states[:5]):
+            h ^= int(np.bitwise_xor.reduce(self.cell_keys[layer, board, self._ys, self._xs], axis=None))
+        player_meta = board_states[5]
+        for (row, col), value in np.ndenumerate(player_meta):
+            h ^= self._meta_key(row, col, value)
+        return h
+
+    def update(self, h, changes, prev_meta, player_meta):
+        '''
+        hash of a state given the hash h of the state it was stepped from. changes are the
+        (layer, y, x, old value, new value) board cells the step changed (BMBoard.step_changes),
+        only those are rehashed. the player_meta rows are small enough to compare
+        '''
+        keys = self._cell_keys
+        for layer, y, x, old, new in changes:
+            h ^= keys[layer][old][y][x] ^ keys[layer][new][y][x]
+        for row, col in np.argwhere(prev_meta != player_meta).tolist():
+            h ^= self._meta_key(row, col, prev_meta[row, col]) ^ self._meta_key(row, col, player_meta[row, col])
+        return h
+
+    def step(self, game, actions, board_states, h):
+        '''
+        game.step in simulate mode from board_states with hash h, returns the new state and its hash
+        '''
+        new_states, changes = game.step_changes(actions, board_states)
+        return new_states, self.update(h, changes, board_states[5], new_states[5])